@@ -316,7 +316,7 @@ def record_physics(solver, opts=None):
 
 @_wraps(_dump.export)
 def export_physics(fname=None, opts=None):
-    return _dump.export(fname, opts)
+    return _dump.export(fname, opts=opts)
 
 
 @_wraps(_dump.reinterpret)
@@ -0,0 +1,309 @@
+"""Process many .rag files at once, without Maya
+
+Each file is read, passed through one or more transforms, validated
+and written back in place. Files are processed in parallel, one per
+process, and results are streamed back as each file finishes.
+
+# Usage Example
+
+$ python -m ragdoll.batch assets/*.rag
+$ python -m ragdoll.batch --transform linearAngularStiffness assets/*.rag
+$ python -m ragdoll.batch --validate --dry-run assets/*.rag
+
+# Transforms
+
+A transform is a function taking the full contents of a file, modifying
+it in place and returning whether anything changed. Transforms are
+registered by name and run in the order they were registered.
+
+    @batch.transform("myTransform")
+    def my_transform(data):
+        ...
+        return changed
+
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+import traceback
+import collections
+
+from . import ragfile, rag
+
+try:
+    from concurrent import futures
+except ImportError:
+    # Python 2, files are processed one at a time
+    futures = None
+
+log = logging.getLogger("ragdoll")
+
+# Name -> function, in order of registration
+Transforms = collections.OrderedDict()
+
+
+def transform(name):
+    """Register the decorated function as transform `name`"""
+
+    def decorator(func):
+        Transforms[name] = func
+        return func
+
+    return decorator
+
+
+@transform("linearAngularStiffness")
+def upgrade_linear_angular_stiffness(data):
+    """Split stiffness and damping into linear and angular
+
+    Files exported prior to the separation of linear and angular
+    stiffness get their original values carried over. Components
+    already carrying the new members are left alone.
+
+    """
+
+    changed = False
+
+    for entity, value in data["entities"].items():
+        components = value["components"]
+
+        if "GroupUIComponent" in components:
+            ui = components["GroupUIComponent"]["members"]
+
+            if "angularStiffness" not in ui:
+                ui["useLinearAngularStiffness"] = True
+                ui["angularStiffness"] = ui["stiffness"]
+                ui["angularDampingRatio"] = ui["dampingRatio"]
+                ui["linearStiffness"] = ui["driveRelativeLinearStiffness"]
+                ui["linearDampingRatio"] = (
+                    ui["driveRelativeLinearDampingRatio"]
+                )
+                changed = True
+
+        if "MarkerUIComponent" in components:
+            ui = components["MarkerUIComponent"]["members"]
+
+            if "angularStiffness" not in ui:
+                ui["useLinearAngularStiffness"] = True
+                ui["angularStiffness"] = ui["driveStiffness"]
+                ui["angularDampingRatio"] = ui["driveDampingRatio"]
+                ui["linearStiffness"] = ui["driveRelativeLinearStiffness"]
+                ui["linearDampingRatio"] = (
+                    ui["driveRelativeLinearDampingRatio"]
+                )
+                changed = True
+
+        if "PinJointUIComponent" in components:
+            con = components["PinJointUIComponent"]["members"]
+
+            if "useScale" not in con:
+                con["useScale"] = True
+                changed = True
+
+        if "DistanceJointUIComponent" in components:
+            con = components["DistanceJointUIComponent"]["members"]
+
+            if "useScale" not in con:
+                con["useScale"] = True
+                con["useScaleForDistance"] = True
+                changed = True
+
+    return changed
+
+
+def process(fname, transforms=None, opts=None):
+    """Run `transforms` on `fname`, and write it if anything changed
+
+    Arguments:
+        fname (str): Absolute path to .rag file
+        transforms (list, optional): Functions, see `transform`
+        opts (dict, optional): Options
+
+    Options:
+        validate (bool): Validate the result, see `rag.validate`
+        dryRun (bool): Do everything but write the file
+        format (int): Write in this format, rather than the original
+        compression (int): Write with this compression instead
+
+    Patches are never transformed nor written, as they only hold
+    differences to another file; transform that file instead. They
+    are validated with their base applied.
+
+    Returns:
+        dict: Outcome, with the name of every transform that changed
+            the file, reasons it is invalid and any error raised
+
+    """
+
+    opts = dict({
+        "validate": False,
+        "dryRun": False,
+        "format": None,
+        "compression": None,
+    }, **(opts or {}))
+
+    result = {
+        "fname": fname,
+        "changed": [],
+        "reasons": [],
+        "written": False,
+        "patch": False,
+        "error": None,
+    }
+
+    try:
+        # Everything is written back, so there's no use reading lazily
+        data = ragfile.materialise(ragfile.read(fname, indexed=False))
+
+        if data.get("schema") == rag.PatchSchema:
+            result["patch"] = True
+
+            if opts["validate"]:
+                result["reasons"] = rag.validate(
+                    rag.read(fname, indexed=False)
+                )
+
+            return result
+
+        for func in transforms or []:
+            if func(data):
+                result["changed"].append(func.__name__)
+
+        if opts["validate"]:
+            result["reasons"] = rag.validate(data)
+
+        write_opts = ragfile.options(fname)
+        converted = False
+
+        for key in ("format", "compression"):
+            if opts[key] is not None and opts[key] != write_opts[key]:
+                write_opts[key] = opts[key]
+                converted = True
+
+        if (result["changed"] or converted) and not opts["dryRun"]:
+            # Transforms leave name, thumbnail and counts alone
+            write_opts["metadata"] = ragfile.read_metadata(
+                fname, fallback=False
+            )
+
+            ragfile.write(fname, data, write_opts)
+            result["written"] = True
+
+    except Exception:
+        result["error"] = traceback.format_exc()
+
+    return result
+
+
+def run(fnames, transforms=None, workers=None, opts=None):
+    """Process each of `fnames` in parallel, yielding results as they finish
+
+    Arguments:
+        fnames (list): Absolute paths to .rag files
+        transforms (list, optional): Names or functions, defaults
+            to every registered transform
+        workers (int, optional): Number of processes, defaults to
+            the number of processors. One means no extra processes.
+        opts (dict, optional): Options, see `process`
+
+    Example:
+        >>> for result in run(["a.rag", "b.rag"]):  # doctest: +SKIP
+        ...     print(result["fname"], result["changed"])
+        a.rag ['upgrade_linear_angular_stiffness']
+        b.rag []
+
+    """
+
+    if transforms is None:
+        transforms = list(Transforms)
+
+    transforms = [
+        Transforms[func] if isinstance(func, rag.string_types) else func
+        for func in transforms
+    ]
+
+    if futures is None or workers == 1 or len(fnames) < 2:
+        for fname in fnames:
+            yield process(fname, transforms, opts)
+
+        return
+
+    with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = [
+            executor.submit(process, fname, transforms, opts)
+            for fname in fnames
+        ]
+
+        for job in futures.as_completed(jobs):
+            yield job.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ragdoll.batch",
+        description="Transform and validate .rag files, in parallel"
+    )
+
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--transform", action="append",
+                        choices=list(Transforms),
+                        help="Defaults to every transform")
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Don't write anything")
+    parser.add_argument("--workers", type=int,
+                        help="Defaults to the number of processors")
+    parser.add_argument("--json", action="store_true",
+                        help="Print one result per line as JSON")
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(message)s")
+
+    fnames = [os.path.abspath(fname) for fname in args.files]
+    failed = False
+
+    for result in run(fnames,
+                      transforms=args.transform,
+                      workers=args.workers,
+                      opts={"validate": args.validate,
+                            "dryRun": args.dry_run}):
+
+        failed = failed or bool(result["error"] or result["reasons"])
+
+        if args.json:
+            sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+            continue
+
+        if result["error"]:
+            status = "error"
+        elif result["reasons"]:
+            status = "invalid"
+        elif result["patch"]:
+            status = "patch"
+        elif result["written"]:
+            status = "written"
+        elif result["changed"]:
+            status = "changed"
+        else:
+            status = "unchanged"
+
+        sys.stdout.write("%s: %s\n" % (result["fname"], status))
+
+        for name in result["changed"]:
+            sys.stdout.write("  %s\n" % name)
+
+        for reason in result["reasons"]:
+            sys.stdout.write("  %s\n" % reason)
+
+        if result["error"]:
+            sys.stdout.write(result["error"])
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
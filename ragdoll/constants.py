@@ -10,6 +10,15 @@ RAGDOLL_NO_TELEMETRY = bool(os.getenv("RAGDOLL_NO_TELEMETRY"))
 RAGDOLL_FLOATING = os.getenv("RAGDOLL_FLOATING", "")
 RAGDOLL_TELEMETRY = bool(os.getenv("RAGDOLL_TELEMETRY"))
 
+# Megabytes of parsed .rag files to keep in memory, see `ragfile.cache`
+RAGDOLL_READ_CACHE = int(os.getenv("RAGDOLL_READ_CACHE", "256"))
+
+# Megabytes of scaled thumbnails to keep on disk, see `ui.posters`
+RAGDOLL_POSTER_CACHE = int(os.getenv("RAGDOLL_POSTER_CACHE", "32"))
+
+# Megabytes of indices of plain JSON files to keep, see `ragfile.read`
+RAGDOLL_INDEX_CACHE = int(os.getenv("RAGDOLL_INDEX_CACHE", "64"))
+
 CREATE_NEW_SOLVER = 0
 
 # Shape types
@@ -88,6 +97,13 @@ QuaternionFilter = 2
 MatchByName = 0
 MatchByHierarchy = 1
 
+FormatAscii = 0
+FormatBinary = 1
+
+CompressionOff = 0
+CompressionGzip = 1
+CompressionLzma = 2
+
 RecordFastAndLoose = 0
 RecordNiceAndSteady = 1
 
@@ -9,16 +9,24 @@ dedump(dump)
 """
 
 import os
+import re
 import json
 import copy
+import fnmatch
 import logging
 import itertools
 
 from maya import cmds
 from .vendor import cmdx
-from . import commands, internal, constants
+from . import commands, internal, constants, ragfile, rag
 
 
+try:
+    import numpy
+except ImportError:
+    # Not bundled with every version of Maya
+    numpy = None
+
 log = logging.getLogger("ragdoll")
 
 
@@ -62,12 +70,15 @@ def reinterpret(fname, opts=None):
     return loader.reinterpret()
 
 
-def export(fname=None, data=None):
+def export(fname=None, data=None, opts=None):
     """Export everything Ragdoll-related into `fname`
 
     Arguments:
         fname (str, optional): Write to this file
         data (dict, optional): Export this dictionary instead
+        opts (dict, optional): Options, see `ragfile.write`, along
+            with `base`; a previously exported file to write only the
+            changes since, see `rag.write_patch`
 
     Returns:
         data (dict): Exported data as a dictionary
@@ -90,153 +101,296 @@ def export(fname=None, data=None):
     # Keep filename in the dump
     data["ui"]["filename"] = fname or "Memory"
 
-    if fname is not None:
-        with open(fname, "w") as f:
-            json.dump(data, f, indent=4, sort_keys=True)
+    base = (opts or {}).get("base")
+
+    if fname is not None and base:
+        rag.write_patch(fname, base, data, opts)
+
+    elif fname is not None:
+        ragfile.write(fname, data, opts)
 
     cmds.currentTime(cmdx.min_time().value)
 
     return data
 
 
-class Entity(int):
-    pass
+Entity = rag.Entity
 
 
-def _value_to_type(value):
-    if isinstance(value, (list, tuple)):
-        value = [_value_to_type(v) for v in value]
+class PointArray(rag.PointArray):
+    """Contiguous buffer of `cmdx.Point`, see `rag.PointArray`"""
 
-    elif not isinstance(value, dict):
-        pass
+    Point = cmdx.Point
 
-    elif value["type"] == "Entity":
-        value = Entity(value["value"])
 
-    elif value["type"] == "Vector3":
-        value = cmdx.Vector(value["values"])
+class QuantizedPointArray(rag.QuantizedPointArray):
+    """Quantized points, dequantized to `PointArray`"""
 
-    elif value["type"] == "Color4":
-        value = cmdx.Color(value["values"])
+    PointArray = PointArray
 
-    elif value["type"] == "Matrix44":
-        value = cmdx.Matrix4(value["values"])
 
-    elif value["type"] == "Path":
-        value = value["value"]
+def _quaternion(values):
+    return cmdx.Quaternion(*values)
 
-    elif value["type"] == "Quaternion":
-        value = cmdx.Quaternion(*value["values"])
 
-    elif value["type"] == "PointArray":
-        values = []
+class Registry(rag.Registry):
+    """Entities and their components, with members as Maya types
 
-        # Values are stored flat; every 3 values represent an Point
-        stride = 0
-        for _ in range(len(value["values"]) // 3):
-            values.append(cmdx.Point(
-                value["values"][stride + 0],
-                value["values"][stride + 1],
-                value["values"][stride + 2],
-            ))
+    See `rag.Registry`.
 
-            stride += 3
-        value = values
+    """
 
-    elif value["type"] == "UintArray":
-        value = value["values"]
+    Types = dict(rag.Types, **{
+        "Vector3": cmdx.Vector,
+        "Color4": cmdx.Color,
+        "Matrix44": cmdx.Matrix4,
+        "Quaternion": _quaternion,
+        "PointArray": PointArray,
+        "QuantizedPointArray": QuantizedPointArray,
+    })
 
-    else:
-        raise TypeError("Unsupported type: %s" % value)
 
-    return value
+class PathRewriter(object):
+    """Rewrite exported paths per search-and-replace and namespace options
 
+    Rules are compiled once per set of options, and the rewritten
+    paths remembered, such that paths are only ever rewritten once.
 
-def Component(comp):
-    """Simplified access to component members"""
+    Replacements are applied one after the other, such that the
+    result of one may be replaced by the next.
 
-    data = {}
+    Arguments:
+        search_and_replace (tuple): Space-separated search terms,
+            along with their space-separated replacements
+        namespace (str): Replace namespace of each path with this,
+            " " to remove namespaces, or None to leave them as-is
+        match_by (int): One of constants.MatchBy*
+
+    Example:
+        >>> by_hierarchy = constants.MatchByHierarchy
+        >>> rewriter = PathRewriter(("_L _ctl", "_R"), None, by_hierarchy)
+        >>> rewriter.rewrite("|root|arm_L_ctl")
+        '|root|arm_R'
+        >>> rewriter = PathRewriter(("", ""), "new", by_hierarchy)
+        >>> rewriter.rewrite("|old:root|old:arm")
+        ':new:|:new:root|:new:arm'
 
-    for key, value in comp["members"].items():
-        if isinstance(value, (dict, list, tuple)):
-            value = _value_to_type(value)
+    """
 
-        data[key] = value
+    # Everything up to and including the last colon of a name
+    NamespaceRe = re.compile(r"[^|]*:")
 
-    return data
+    def __init__(self, search_and_replace, namespace, match_by):
+        search, replace = search_and_replace
+        search_terms = search.split(" ")
+        replace_terms = replace.split(" ")
 
+        if len(search_terms) > len(replace_terms):
+            for term in search_terms[len(replace_terms):]:
+                replace_terms.append("")
 
-class Registry(object):
-    def __init__(self, dump=None):
-        if dump is None:
-            dump = {
-                "entities": {}
-            }
+        self._replacements = tuple(
+            (a, b) for a, b in zip(search_terms, replace_terms) if a != b
+        )
 
-        dump = copy.deepcopy(dump)
-        dump["entities"] = {
+        # Give namespace-less paths an empty namespace such
+        # that it can be replaced, hence the leading colon
+        if namespace and namespace != " ":
+            namespace = ":%s:" % namespace.replace(" ", "")
 
-            # Original JSON stores keys as strings, but the original
-            # keys are integers; i.e. entity IDs
-            Entity(entity): value
-            for entity, value in dump["entities"].items()
-        }
+        self._namespace = namespace
+        self._by_name = match_by == constants.MatchByName
+        self._rewritten = {}
 
-        self._dump = dump
+    def rewrite(self, path):
+        """Return rewritten `path`"""
+        if not path:
+            return ""
 
-    def count(self, *components):
-        """Return number of entities with this component(s)"""
-        return len(list(self.view(*components)))
+        try:
+            return self._rewritten[path]
+        except KeyError:
+            pass
 
-    def view(self, *components):
-        """Iterate over every entity that has all of `components`"""
-        for entity in self._dump["entities"]:
-            if all(self.has(entity, comp) for comp in components):
-                yield entity
+        result = path
 
-    def has(self, entity, component):
-        """Return whether `entity` has `component`"""
-        assert isinstance(entity, int), "entity must be int"
-        assert isinstance(component, cmdx.string_types), (
-            "component must be string")
-        return component in self._dump["entities"][entity]["components"]
+        for a, b in self._replacements:
+            result = result.replace(a, b)
 
-    def get(self, entity, component):
-        """Return `component` for `entity`
+        # Remove namespace from `path`
+        if self._namespace == " ":
+            result = self.NamespaceRe.sub("", result)
 
-        Returns:
-            dict: The component
+        # Replace namespace in `path`
+        elif self._namespace:
+            result = "|".join(
+                self._namespace + comp.rsplit(":", 1)[-1]
+                for comp in result.split("|")
+            )
 
-        Raises:
-            KeyError: if `entity` does not have `component`
+        if self._by_name:
+            result = result.rsplit("|", 1)[-1]
 
-        Example:
-            >>> s = {}
-            >>> dump = cmds.ragdollDump()
-            >>> dump["entities"][1] = {"components": {"SceneComponent": s}}
-            >>> loader = Loader(dump)
-            >>> assert s == loader.component(1, "SceneComponent")
+        # In case of double || characters
+        result = result.replace("||", "|")
 
-        """
+        # Support wildcard names
+        # E.g. :manikin:L_arm -> :manikin:*L_arm
+        if self._by_name:
+            if ":" in result and "|" not in result:
+                result = "{0}:*{1}".format(*result.rsplit(":", 1))
 
-        try:
-            components = self._dump["entities"][entity]["components"]
-            return Component(components[component])
+        self._rewritten[path] = result
+        return result
 
-        except KeyError as e:
-            if self.has(entity, "NameComponent"):
-                Name = self.get(entity, "NameComponent")
-                name = Name["path"] or Name["value"]
-            else:
-                name = "Entity: %d" % entity
 
-            raise KeyError("%s did not have '%s' (%s) {%s}" % (
-                name, component, e, ", ".join(components.keys()))
+class SceneIndex(object):
+    """Resolve many paths and names to nodes, from one listing of the scene
+
+    Every transform is listed once up-front and looked up by full path,
+    by unique name and by wildcard name within a namespace. That is the
+    kind of name `Loader` searches for with MatchByName. Anything else
+    is resolved with `cmdx.encode`. Each term is resolved only once,
+    and `Loader` keeps an index for as long as the scene is unchanged,
+    see `scene_generation`.
+
+    Example:
+        >>> index = SceneIndex()  # doctest: +SKIP
+        >>> index.resolve(":manikin:*L_arm")  # doctest: +SKIP
+        |manikin:root|manikin:L_arm
+
+    """
+
+    def __init__(self):
+        paths = cmds.ls(type="transform", long=True) or []
+
+        self._paths = set(paths)
+
+        # Map name -> paths with that name, e.g. L_arm -> [|root|L_arm]
+        self._names = {}
+
+        # Map namespace -> (name, path) pairs, in scene order
+        self._namespaces = {}
+
+        for path in paths:
+            name = path.rsplit("|", 1)[-1]
+            namespace, _, leaf = name.rpartition(":")
+            self._names.setdefault(name, []).append(path)
+            self._namespaces.setdefault(namespace, []).append((leaf, path))
+
+        self._resolved = {}
+
+        # Map transform -> whether it already has a marker
+        self._assigned = {}
+
+    def resolve(self, term):
+        """Return node at path or name `term`, or None if not found"""
+        if term not in self._resolved:
+            self._resolved[term] = self._resolve(term)
+
+        return self._resolved[term]
+
+    def is_assigned(self, transform):
+        """Return whether `transform` already has a marker"""
+        if transform not in self._assigned:
+            self._assigned[transform] = bool(
+                transform["message"].output(type="rdMarker")
             )
 
-    def components(self, entity):
-        """Return *all* components for `entity`"""
-        return self._dump["entities"][entity]["components"]
+        return self._assigned[transform]
+
+    def _resolve(self, term):
+        # Leading colons signify the root namespace, e.g. |:ns:a|:ns:b
+        normal = "|".join(comp.lstrip(":") for comp in term.split("|"))
+
+        if not any(char in normal for char in "*?["):
+            if normal in self._paths:
+                path = normal
+
+            elif len(self._names.get(normal, [])) == 1:
+                path = self._names[normal][0]
+
+            else:
+                # E.g. relative paths or ambiguous names
+                path = term
+
+        else:
+            namespace, _, pattern = normal.rpartition(":")
+
+            if "|" in normal or any(char in namespace for char in "*?["):
+                path = term
+
+            else:
+                for leaf, path in self._namespaces.get(namespace, []):
+                    if fnmatch.fnmatchcase(leaf, pattern):
+                        break
+                else:
+                    return None
+
+        try:
+            return cmdx.encode(path)
+        except cmdx.ExistError:
+            return None
+
+
+# Changes to the scene, counted by callbacks, see `install_callbacks`
+_scene = {
+    "generation": 0,
+    "callbacks": [],
+}
+
+
+def _on_scene_changed(*args):
+    _scene["generation"] += 1
+
+
+def install_callbacks():
+    """Count changes to the scene, see `scene_generation`"""
+    uninstall_callbacks()
+
+    om = cmdx.om
+    callbacks = _scene["callbacks"]
+
+    # Nodes created, deleted, renamed and reparented
+    callbacks.append(om.MDGMessage.addNodeAddedCallback(
+        _on_scene_changed, "dependNode"))
+    callbacks.append(om.MDGMessage.addNodeRemovedCallback(
+        _on_scene_changed, "dependNode"))
+    callbacks.append(om.MNodeMessage.addNameChangedCallback(
+        om.MObject.kNullObj, _on_scene_changed))
+    callbacks.append(om.MDagMessage.addAllDagChangesCallback(
+        _on_scene_changed))
+
+    for message in (om.MSceneMessage.kAfterNew,
+                    om.MSceneMessage.kAfterOpen,
+                    om.MSceneMessage.kAfterImport,
+                    om.MSceneMessage.kAfterLoadReference,
+                    om.MSceneMessage.kAfterUnloadReference):
+        callbacks.append(om.MSceneMessage.addCallback(
+            message, _on_scene_changed))
+
+
+def uninstall_callbacks():
+    for callback in _scene["callbacks"]:
+        cmdx.om.MMessage.removeCallback(callback)
+
+    _scene["callbacks"][:] = []
+
+
+def scene_generation():
+    """Return a number that changes along with the scene
+
+    Returns:
+        int: Changes whenever nodes are created, deleted, renamed or
+            reparented, or None if unknown as `install_callbacks`
+            has not been called, e.g. from mayapy
+
+    """
+
+    if not _scene["callbacks"]:
+        return None
+
+    return _scene["generation"]
 
 
 def _name(Name, level=-1):
@@ -283,6 +437,15 @@ def DefaultState():
 
         # Paths used to search for each marker
         "searchTerms": {},
+
+        # Markers not already assigned, in order
+        "unoccupied": [],
+
+        # Map solver entity -> its marker entities, in order
+        "solverToMarkers": {},
+
+        # Map group entity -> its marker entities, in order
+        "groupToMarkers": {},
     }
 
 
@@ -302,7 +465,22 @@ class Loader(object):
 
     """
 
-    SupportedSchema = "ragdoll-1.0"
+    SupportedSchema = rag.SupportedSchema
+
+    # Stages of `analyse` in order, along with the options they depend on.
+    # Editing an option only re-runs the stages that depend on it, apart
+    # from `SceneStages` which are also re-run once the scene has changed.
+    AnalysisStages = (
+        ("constraints", ()),
+        ("solvers", ()),
+        ("groups", ()),
+        ("markers", ("roots", "searchAndReplace", "namespace", "matchBy")),
+        ("membership", ("roots", "searchAndReplace", "namespace", "matchBy")),
+        ("collisionGroups", ()),
+    )
+
+    # Stages reading the Maya scene, which may change at any time
+    SceneStages = ("markers", "membership")
 
     def __init__(self, opts=None):
         opts = dict({
@@ -322,6 +500,12 @@ class Loader(object):
         # Do we need to re-analyse before use?
         self._dirty = True
 
+        # Stages of `analyse` affected by edits since it last ran
+        self._stale = set()
+
+        # Map component name -> entities, in creation order
+        self._sorted = {}
+
         # Is the data valid, e.g. no null-entities?
         self._invalid_reasons = []
 
@@ -336,6 +520,24 @@ class Loader(object):
         # Default, in case data is passed in directly rather than a file
         self._current_fname = "character"
 
+        # State of `_current_fname` on disk when read, see `_refresh`
+        self._read_key = None
+
+        # Map (mesh key, scale) -> MObject of mesh data, see `_mesh_data`
+        self._mesh_cache = {}
+
+        # Called with a step and percentage during `reinterpret`
+        self._progress = None
+
+        # Rewriter of the current options, see `_pre_process_path`
+        self._rewriter = None
+
+        # Generation and index of the scene, see `_scene_index`
+        self._scene = None
+
+        # Generation of the scene when last analysed
+        self._analysed = None
+
     def count(self):
         return len(self._state["entityToTransform"])
 
@@ -347,11 +549,49 @@ class Loader(object):
         return copy.deepcopy(self._dump)
 
     def edit(self, options):
+        changed = set(
+            key for key, value in options.items()
+            if self._opts.get(key) != value
+        )
+
         self._opts.update(options)
-        self._dirty = True
 
-    def read(self, fname):
+        for stage, dependencies in self.AnalysisStages:
+            if changed.intersection(dependencies):
+                self._stale.add(stage)
+
+        # E.g. a rig was referenced or markers deleted since
+        if self._scene_changed():
+            self._stale.update(self.SceneStages)
+
+    def _scene_changed(self):
+        """Return whether the scene may have changed since last analysed"""
+        generation = scene_generation()
+        return generation is None or generation != self._analysed
+
+    def _scene_index(self):
+        """Return an index of the scene, reused until the scene changes"""
+        generation = scene_generation()
+
+        if (generation is None or
+                self._scene is None or
+                self._scene[0] != generation):
+            self._scene = (generation, SceneIndex())
+
+        return self._scene[1]
+
+    def read(self, fname, data=None):
+        """Read `fname`, or use its `data` if it has already been read
+
+        Arguments:
+            fname (str): Absolute path to .rag file
+            data (dict, optional): Contents of `fname`, e.g. as read
+                from another thread by `rag.read`
+
+        """
+
         self._invalid_reasons[:] = []
+        self._read_key = None
 
         dump = DefaultDump()
 
@@ -359,11 +599,22 @@ class Loader(object):
             # Developer-mode, bypass everything and use as-is
             dump = fname
 
+        elif data is not None:
+            dump = data
+            self._current_fname = fname
+
+            try:
+                self._read_key = ragfile.ReadCache.key(fname)
+            except OSError:
+                # Deleted since it was read
+                pass
+
         else:
             try:
-                with open(fname) as f:
-                    dump = json.load(f)
+                key = ragfile.ReadCache.key(fname)
+                dump = rag.read(fname, cached=True)
                 self._current_fname = fname
+                self._read_key = key
 
             except Exception as e:
                 error = (
@@ -377,9 +628,48 @@ class Loader(object):
             "Dump not compatible with this version of Ragdoll"
         )
 
-        self._registry = Registry(dump)
+        self._registry = Registry(dump, copy_on_write=True)
         self._dump = dump
         self._dirty = True
+        self._sorted.clear()
+        self._mesh_cache.clear()
+
+    def _refresh(self):
+        """Re-read a file changed since it was read, and read it whole
+
+        Components are otherwise read on demand, and refused once
+        their file has changed. Reading them up-front means a file
+        re-exported after it was read cannot fail an import halfway.
+
+        """
+
+        fname = self._current_fname
+
+        if self._read_key is not None:
+            try:
+                changed = ragfile.ReadCache.key(fname) != self._read_key
+
+            except OSError:
+                # Deleted since, make do with what was read
+                changed = False
+
+            if changed:
+                log.info("%s has changed since it was read, re-reading.."
+                         % fname)
+                self.read(fname)
+
+        try:
+            dump = ragfile.materialise(self._dump)
+
+        except IOError:
+            # E.g. the base of a patch was re-exported
+            log.info("%s has changed since it was read, re-reading.."
+                     % fname)
+            self.read(fname)
+            dump = ragfile.materialise(self._dump)
+
+        self._registry = Registry(dump, copy_on_write=True)
+        self._dump = dump
 
     def is_valid(self):
         return len(self._invalid_reasons) == 0
@@ -389,27 +679,14 @@ class Loader(object):
         return self._invalid_reasons[:]
 
     def create(self, assembly):
-        seen = {}
         created = {}
 
-        def recursive_create(mod, entity, group):
-            if entity in seen:
-                return
-
-            # Avoid cycles
-            seen[entity] = True
-
+        def create_joint(mod, entity, local, group):
             Rigid = self._registry.get(entity, "RigidComponent")
             MarkerUi = self._registry.get(entity, "MarkerUIComponent")
-            Rest = self._registry.get(entity, "RestComponent")
-            Scale = self._registry.get(entity, "ScaleComponent")
 
             parent = Rigid["parentRigid"]
 
-            # Ensure we've created the parent already
-            if parent and parent not in created:
-                recursive_create(mod, parent, group)
-
             path = MarkerUi["sourceTransform"]
             name = path.rsplit("|", 1)[-1].rsplit(":", 1)[-1]
             parent_transform = created.get(parent) or group
@@ -417,23 +694,7 @@ class Loader(object):
                                     name=name,
                                     parent=parent_transform)
 
-            # Incorporate scale early, to ensure it
-            # cancels out in case of scaled parents
-            tm = cmdx.Tm(Rest["matrix"])
-            tm.set_scale(Scale["value"])
-            mtx = tm.as_matrix()
-
             if parent:
-                ParentRest = self._registry.get(parent, "RestComponent")
-                ParentScale = self._registry.get(parent, "ScaleComponent")
-
-                parent_mtx = ParentRest["matrix"]
-                parent_tm = cmdx.Tm(parent_mtx)
-                parent_tm.set_scale(ParentScale["value"])
-                parent_mtx = parent_tm.as_matrix()
-
-                mtx *= parent_mtx.inverse()
-
                 linear_motion = MarkerUi.get("linearMotion", "Locked")
                 if linear_motion == "Inherit":
                     Group = self._registry.get(entity, "GroupComponent")
@@ -470,7 +731,7 @@ class Loader(object):
                 mod.lock_attr(joint["scaleY"])
                 mod.lock_attr(joint["scaleZ"])
 
-            tm = cmdx.Tm(mtx)
+            tm = cmdx.Tm(local)
 
             mod.set_attr(joint["translate"], tm.translation())
             mod.set_attr(joint["jointOrient"], tm.rotation())
@@ -485,12 +746,36 @@ class Loader(object):
             joint = mod.create_node("joint", name=name, parent=joint)
             mod.set_attr(joint["translate"], offset * 2)
 
+        # Parents are created before their children, walking up rather
+        # than recursing down such that long chains and tails don't
+        # run into Python's recursion limit.
+        ordered = []
+        seen = set()
+
+        for entity in self._registry.view("RigidComponent",
+                                          "MarkerUIComponent"):
+            chain = []
+
+            # Avoid cycles
+            while entity not in seen:
+                seen.add(entity)
+                chain.append(entity)
+
+                Rigid = self._registry.get(entity, "RigidComponent")
+                entity = Rigid["parentRigid"]
+
+                if not entity:
+                    break
+
+            ordered.extend(reversed(chain))
+
+        local_matrices = self._local_rest_matrices(ordered)
+
         with cmdx.DagModifier() as mod:
             skeleton_grp = assembly | "skeleton_grp"
 
-            for entity in self._registry.view("RigidComponent",
-                                              "MarkerUIComponent"):
-                recursive_create(mod, entity, skeleton_grp)
+            for entity, local in zip(ordered, local_matrices):
+                create_joint(mod, entity, local, skeleton_grp)
 
             for entity, joint in created.items():
                 if joint.child(type="joint"):
@@ -503,25 +788,160 @@ class Loader(object):
 
         return created
 
+    def _local_rest_matrices(self, entities):
+        """Return rest matrix of each of `entities` relative its parent
+
+        Scale is incorporated early, to ensure it cancels out in case
+        of scaled parents. Each parent must either be part of `entities`
+        or have been computed earlier.
+
+        Computed all at once with NumPy, where available and where
+        each rest matrix is free of shear and mirroring. Anything else
+        is decomposed by Maya, via `cmdx.Tm`.
+
+        """
+
+        parents = [
+            self._registry.get(entity, "RigidComponent")["parentRigid"]
+            for entity in entities
+        ]
+
+        # Any parent not part of `entities` is computed alongside them
+        entities = list(entities)
+        for parent in parents:
+            if parent and parent not in entities:
+                entities.append(parent)
+
+        def scaled_rest(entity):
+            Rest = self._registry.get(entity, "RestComponent")
+            Scale = self._registry.get(entity, "ScaleComponent")
+            return Rest["matrix"], Scale["value"]
+
+        def with_maya():
+            results = []
+
+            for entity, parent in zip(entities, parents):
+                matrix, scale = scaled_rest(entity)
+                tm = cmdx.Tm(matrix)
+                tm.set_scale(scale)
+                mtx = tm.as_matrix()
+
+                if parent:
+                    matrix, scale = scaled_rest(parent)
+                    parent_tm = cmdx.Tm(matrix)
+                    parent_tm.set_scale(scale)
+                    mtx = mtx * parent_tm.as_matrix().inverse()
+
+                results.append(mtx)
+
+            return results
+
+        if numpy is None:
+            return with_maya()
+
+        matrices, scales = [], []
+        for entity in entities:
+            matrix, scale = scaled_rest(entity)
+            matrices.append(list(matrix))
+            scales.append(list(scale))
+
+        matrices = numpy.array(matrices, dtype=numpy.float64).reshape(-1, 4, 4)
+        scales = numpy.array(scales, dtype=numpy.float64)
+
+        # Replace scale of each matrix, i.e. the length of each axis
+        axes = matrices[:, :3, :3]
+        lengths = numpy.linalg.norm(axes, axis=2)
+        lengths[lengths == 0] = 1
+        rotations = axes / lengths[..., None]
+
+        # Maya decomposes shear and mirroring separately from scale,
+        # which replacing the length of each axis wouldn't preserve
+        orthogonal = numpy.allclose(
+            numpy.matmul(rotations, rotations.transpose(0, 2, 1)),
+            numpy.eye(3),
+            atol=1e-6
+        )
+
+        if not orthogonal or (numpy.linalg.det(rotations) <= 0).any():
+            return with_maya()
+
+        matrices[:, :3, :3] = rotations * scales[..., None]
+
+        index = {entity: row for row, entity in enumerate(entities)}
+        children = [row for row, parent in enumerate(parents) if parent]
+        rows = [index[parents[row]] for row in children]
+
+        results = matrices[:len(parents)].copy()
+
+        if children:
+            try:
+                inverses = numpy.linalg.inv(matrices[rows])
+
+            except numpy.linalg.LinAlgError:
+                # E.g. a zero scale, let Maya handle it
+                inverses = numpy.array([
+                    list(cmdx.Matrix4(matrix.ravel().tolist()).inverse())
+                    for matrix in matrices[rows]
+                ]).reshape(-1, 4, 4)
+
+            results[children] = numpy.matmul(matrices[children], inverses)
+
+        results = [
+            cmdx.Matrix4(matrix.ravel().tolist()) for matrix in results
+        ]
+
+        if constants.RAGDOLL_DEVELOPER:
+            # Both ways of computing these must agree
+            for entity, ours, theirs in zip(entities, results, with_maya()):
+                if not ours.isEquivalent(theirs, 1e-5):
+                    log.warning(
+                        "Rest matrix of %s differs from Maya's:\n%s\n%s"
+                        % (entity, ours, theirs)
+                    )
+
+        return results
+
     def analyse(self):
-        """Fill internal state from dump with something we can use"""
+        """Fill internal state from dump with something we can use
+
+        Only stages affected by options edited since the last
+        analysis are re-run, along with those reading the scene
+        if it has changed, unless the dump has changed.
+
+        """
+
+        generation = scene_generation()
+
+        if generation is not None and generation != self._analysed:
+            self._stale.update(self.SceneStages)
 
         # No need for needless work
-        if not self._dirty:
+        if not self._dirty and not self._stale:
             return self._state
 
-        # Clear previous results
-        self._state = DefaultState()
+        stages = {
+            "constraints": self._find_constraints,
+            "solvers": self._find_solvers,
+            "groups": self._find_groups,
+            "markers": self._find_markers,
+            "membership": self._find_membership,
+            "collisionGroups": self._find_collision_groups,
+        }
 
-        self._find_constraints()
-        self._find_solvers()
-        self._find_groups()
-        self._find_markers()
-        self._find_collision_groups()
+        if self._dirty:
+            # Clear previous results
+            self._state = DefaultState()
+            self._stale.update(stages)
+
+        for stage, _ in self.AnalysisStages:
+            if stage in self._stale:
+                stages[stage]()
 
         self.validate()
 
         self._dirty = False
+        self._stale.clear()
+        self._analysed = generation
         return self._state
 
     def validate(self):
@@ -529,8 +949,7 @@ class Loader(object):
         self._invalid_reasons[:] = reasons
 
     def report(self):
-        if self._dirty:
-            self.analyse()
+        self.analyse()
 
         def _name(entity):
             Name = self._registry.get(entity, "NameComponent")
@@ -542,15 +961,22 @@ class Loader(object):
         colgroups = self._state["collisionGroups"]
         markers = self._state["entityToMarker"]
 
+        solver_to_markers = self._state["solverToMarkers"]
+        group_to_markers = self._state["groupToMarkers"]
+
         if solvers:
             log.info("Solvers:")
             for entity in solvers:
-                log.info("  %s.." % _name(entity))
+                log.info("  %s.. (%d markers)" % (
+                    _name(entity), len(solver_to_markers.get(entity, []))
+                ))
 
         if groups:
             log.info("Groups:")
             for entity in groups:
-                log.info("  %s.." % _name(entity))
+                log.info("  %s.. (%d markers)" % (
+                    _name(entity), len(group_to_markers.get(entity, []))
+                ))
 
         if colgroups:
             log.info("Collision Groups:")
@@ -603,9 +1029,11 @@ class Loader(object):
                 if self._registry.has(entity, "ConvexMeshComponents"):
                     Meshes = self._registry.get(entity, "ConvexMeshComponents")
                     Scale = self._registry.get(entity, "ScaleComponent")
-                    mobj = meshes_to_mobj(Meshes,
-                                          Scale["value"],
-                                          parent.object())
+                    mobj = self._mesh_data(Meshes, Scale["value"])
+
+                    # Copying is much cheaper than building it anew
+                    if not mobj.isNull():
+                        mobj = cmdx.om.MFnMesh().copy(mobj, parent.object())
 
                     # For some reason, we can't set inMesh.
                     # So instead, we use the above meshes_to_mobj to generate a
@@ -716,7 +1144,7 @@ class Loader(object):
         return out
 
     @internal.with_undo_chunk
-    def reinterpret(self, dry_run=False):
+    def reinterpret(self, dry_run=False, progress=None):
         """Interpret dump back into the UI-commands used to create them.
 
         For example, if two chains were created using the `Active Chain`
@@ -735,11 +1163,23 @@ class Loader(object):
             physics will be up-to-date but not necessarily the same as
             when it got exported.
 
+        Arguments:
+            dry_run (bool, optional): Report what would be created,
+                without creating anything
+            progress (callable, optional): Called with the name of the
+                current step and its completion in percent, e.g.
+                ("Creating markers", 50.0)
+
         """
 
-        # In case the user forgot or didn't know
-        if self._dirty:
-            self.analyse()
+        self._refresh()
+
+        # In case the user forgot or didn't know, or the scene has
+        # changed since it was last analysed
+        if self._scene_changed():
+            self._stale.update(self.SceneStages)
+
+        self.analyse()
 
         if dry_run:
             return self.report()
@@ -747,14 +1187,20 @@ class Loader(object):
         if not self.is_valid():
             return log.error("Dump not valid")
 
-        if self._opts["createMissingTransforms"]:
-            self._create_missing_transforms()
+        self._progress = progress
+
+        try:
+            if self._opts["createMissingTransforms"]:
+                self._create_missing_transforms()
+
+            rdsolvers = self._create_solvers()
+            rdgroups = self._create_groups(rdsolvers)
+            rdmarkers = self._create_markers(rdgroups, rdsolvers)
+            rdcolgroups = self._create_collision_groups(rdmarkers)
+            rdconstraints = self._create_constraints(rdmarkers)
 
-        rdsolvers = self._create_solvers()
-        rdgroups = self._create_groups(rdsolvers)
-        rdmarkers = self._create_markers(rdgroups, rdsolvers)
-        rdcolgroups = self._create_collision_groups(rdmarkers)
-        rdconstraints = self._create_constraints(rdmarkers)
+        finally:
+            self._progress = None
 
         self._dirty = True
         log.info("Done")
@@ -767,6 +1213,14 @@ class Loader(object):
             "collisionGroups": rdcolgroups.values(),
         }
 
+    def _report(self, step, count, total):
+        """Report progress of `step`, e.g. 50 out of 300 markers"""
+        percent = 100.0 * count / max(1, total)
+        log.debug("%s.. %d/%d" % (step, count, total))
+
+        if self._progress is not None:
+            self._progress(step, percent)
+
     def _create_missing_transforms(self):
         missing = self._state["missing"]
 
@@ -809,7 +1263,9 @@ class Loader(object):
                 scale = Scale["value"]
 
                 if parent:
-                    matrix *= parent["worldInverseMatrix"][0].as_matrix()
+                    matrix = matrix * (
+                        parent["worldInverseMatrix"][0].as_matrix()
+                    )
 
                 tm = cmdx.Tm(matrix)
                 transform["translate"] = tm.translation()
@@ -822,14 +1278,8 @@ class Loader(object):
         log.info("Creating solver(s)..")
 
         rdsolvers = {}
-
-        unoccupied_markers = list(self._state["markers"])
-        for marker in self._state["occupied"]:
-            unoccupied_markers.remove(marker)
-
-        for marker in unoccupied_markers:
-            if marker not in self._state["entityToTransform"]:
-                unoccupied_markers.remove(marker)
+        importable = self._importable_markers()
+        solver_to_markers = self._state["solverToMarkers"]
 
         for entity in self._state["solvers"]:
             if self._opts["overrideSolver"]:
@@ -847,14 +1297,8 @@ class Loader(object):
                     )
 
             # Ensure there is at least 1 marker in it
-            is_empty = True
-            for marker in unoccupied_markers:
-                Scene = self._registry.get(marker, "SceneComponent")
-                if Scene["entity"] == entity:
-                    is_empty = False
-                    break
-
-            if is_empty:
+            if not any(marker in importable
+                       for marker in solver_to_markers.get(entity, [])):
                 continue
 
             Name = self._registry.get(entity, "NameComponent")
@@ -881,14 +1325,8 @@ class Loader(object):
     def _create_groups(self, rdsolvers):
         log.info("Creating group(s)..")
 
-        unoccupied_markers = list(self._state["markers"])
-        for marker in self._state["occupied"]:
-            unoccupied_markers.remove(marker)
-
-        for marker in unoccupied_markers:
-            if marker not in self._state["entityToTransform"]:
-                unoccupied_markers.remove(marker)
-
+        importable = self._importable_markers()
+        group_to_markers = self._state["groupToMarkers"]
         rdgroups = {}
 
         with cmdx.DagModifier() as mod:
@@ -902,14 +1340,8 @@ class Loader(object):
                     continue
 
                 # Ensure there is at least 1 marker in it
-                is_empty = True
-                for marker in unoccupied_markers:
-                    Group = self._registry.get(marker, "GroupComponent")
-                    if Group["entity"] == entity:
-                        is_empty = False
-                        break
-
-                if is_empty:
+                if not any(marker in importable
+                           for marker in group_to_markers.get(entity, [])):
                     continue
 
                 Name = self._registry.get(entity, "NameComponent")
@@ -943,11 +1375,12 @@ class Loader(object):
         rdmarkers = {}
 
         ordered_markers = []
-        unoccupied_markers = list(self._state["markers"])
+        unoccupied_markers = self._state["unoccupied"]
         entity_to_marker = self._state["entityToMarker"]
 
-        for marker in self._state["occupied"]:
-            unoccupied_markers.remove(marker)
+        # Markers are created in bulk; gather what to create first
+        pending = []
+        seen = set()
 
         for entity in unoccupied_markers:
             transform = self._state["entityToTransform"].get(entity)
@@ -963,16 +1396,65 @@ class Loader(object):
                 # Exported marker wasn't part of an exported solver
                 continue
 
+            # Markers go straight into their group, if any
+            Group = self._registry.get(entity, "GroupComponent")
+            rdgroup = rdgroups.get(Group["entity"])
+            rdparent = rdsolver if rdgroup is None else rdgroup
+
             # Added 2022.11.25
-            opts = {
-                "linearAngularStiffness": MarkerUi.get(
-                    "useLinearAngularStiffness", False)
-            }
+            linear_angular = MarkerUi.get("useLinearAngularStiffness", False)
+
+            # As with `commands.assign_marker`, one transform at a time
+            path = transform.path()
+            existing = transform["message"].output(type="rdMarker")
+            if path in seen or existing is not None:
+                raise commands.AlreadyAssigned(
+                    "%s was already assigned a marker" % transform
+                )
+
+            seen.add(path)
+            pending.append((entity, transform, rdparent, linear_angular))
+
+        # Consecutive markers with the same solver or group and options
+        # are created together, preserving the order of the dump
+        def batch_key(item):
+            _, _, rdparent, linear_angular = item
+            return (rdparent, linear_angular)
+
+        for _, batch in itertools.groupby(pending, key=batch_key):
+            batch = list(batch)
+            _, _, rdparent, linear_angular = batch[0]
+
+            markers = commands.assign_markers(
+                [transform for _, transform, _, _ in batch],
+                rdparent,
+                opts={
+                    "connect": False,
+                    "linearAngularStiffness": linear_angular,
+                }
+            )
+
+            # Transforms with a marker already are rejected above,
+            # so none were skipped and markers line up with the batch
+            assert len(markers) == len(batch), (
+                "%d markers created for %d transforms"
+                % (len(markers), len(batch))
+            )
+
+            with cmdx.DGModifier() as mod:
+                for (entity, _, _, _), rdmarker in zip(batch, markers):
+                    rdmarkers[entity] = rdmarker
+                    entity_to_marker[entity] = rdmarker
+                    ordered_markers.append((entity, rdmarker))
 
-            rdmarker = commands.assign_marker(transform, rdsolver, opts=opts)
-            rdmarkers[entity] = rdmarker
-            entity_to_marker[entity] = rdmarker
-            ordered_markers.append((entity, rdmarker))
+                    # Markers after the first are assumed to be a chain
+                    # and stop recording translation, but these aren't
+                    MarkerUi = self._registry.get(entity,
+                                                  "MarkerUIComponent")
+                    mod.set_attr(rdmarker["recordTranslation"],
+                                 MarkerUi.get("recordTranslation", True))
+
+            self._report("Creating markers", len(rdmarkers), len(pending))
 
         if not rdmarkers:
             return rdmarkers
@@ -995,22 +1477,15 @@ class Loader(object):
 
                     mod.do_it()
 
-                for entity, rdmarker in rdmarkers.items():
+                for index, (entity, rdmarker) in enumerate(ordered_markers):
                     try:
                         self._apply_marker(mod, entity, rdmarker)
                     except KeyError as e:
                         # Don't let poorly formatted JSON get in the way
                         log.warning("Could not restore attribute: %s" % e)
 
-        log.info("Adding to group(s)..")
-        with cmdx.DagModifier() as mod:
-            for entity, rdmarker in ordered_markers:
-                Group = self._registry.get(entity, "GroupComponent")
-                rdgroup = rdgroups.get(Group["entity"])
-
-                if rdgroup is not None:
-                    commands._add_to_group(mod, rdmarker, rdgroup)
-                    mod.do_it()  # Commit to group
+                    self._report("Restoring attributes",
+                                 index + 1, len(ordered_markers))
 
         log.info("Reconstructing hierarchy..")
         with cmdx.DagModifier() as mod:
@@ -1175,17 +1650,25 @@ class Loader(object):
 
     def _find_groups(self):
         groups = self._state["groups"]
-        groups[:] = []
+        groups[:] = self._sorted_view("GroupUIComponent")
 
-        for entity in self._registry.view("GroupUIComponent"):
-            groups.append(entity)
+    def _sorted_view(self, component):
+        """Return entities with `component`, in creation order
 
-        # Re-establish creation order
-        def sort(entity):
-            order = self._registry.get(entity, "OrderComponent")
-            return order["value"]
+        The order only changes with the dump, and is computed once.
+
+        """
 
-        groups[:] = sorted(groups, key=sort)
+        if component not in self._sorted:
+            def sort(entity):
+                order = self._registry.get(entity, "OrderComponent")
+                return order["value"]
+
+            self._sorted[component] = sorted(
+                self._registry.view(component), key=sort
+            )
+
+        return list(self._sorted[component])
 
     def _find_collision_groups(self):
         colgroups = self._state["collisionGroups"]
@@ -1194,6 +1677,35 @@ class Loader(object):
         for entity in self._registry.view("CollisionGroupComponent"):
             colgroups.append(entity)
 
+    def _find_membership(self):
+        """Map each solver and group to its markers, in a single pass"""
+        occupied = set(self._state["occupied"])
+        unoccupied = self._state["unoccupied"]
+        solver_to_markers = self._state["solverToMarkers"]
+        group_to_markers = self._state["groupToMarkers"]
+
+        unoccupied[:] = []
+        solver_to_markers.clear()
+        group_to_markers.clear()
+
+        for entity in self._state["markers"]:
+            Scene = self._registry.get(entity, "SceneComponent")
+            Group = self._registry.get(entity, "GroupComponent")
+
+            solver_to_markers.setdefault(Scene["entity"], []).append(entity)
+            group_to_markers.setdefault(Group["entity"], []).append(entity)
+
+            if entity not in occupied:
+                unoccupied.append(entity)
+
+    def _importable_markers(self):
+        """Return markers that are both unoccupied and have a transform"""
+        entity_to_transform = self._state["entityToTransform"]
+        return set(
+            entity for entity in self._state["unoccupied"]
+            if entity in entity_to_transform
+        )
+
     def _find_markers(self):
         """Find and associate each entity with a Maya transform"""
         markers = self._state["markers"]
@@ -1202,10 +1714,21 @@ class Loader(object):
         search_terms = self._state["searchTerms"]
         entity_to_transform = self._state["entityToTransform"]
 
-        for entity in self._registry.view("MarkerUIComponent"):
-            # Collected regardless
-            markers.append(entity)
+        # Re-establish creation order
+        markers[:] = self._sorted_view("MarkerUIComponent")
+
+        occupied[:] = []
+        missing[:] = []
+        search_terms.clear()
+        entity_to_transform.clear()
 
+        # Resolve every search term against one listing of the scene
+        index = self._scene_index()
+
+        # Transforms already claimed by an entity
+        claimed = set()
+
+        for entity in self._registry.view("MarkerUIComponent"):
             MarkerUi = self._registry.get(entity, "MarkerUIComponent")
 
             # Find original path, minus the rigid
@@ -1220,87 +1743,38 @@ class Loader(object):
             if roots and not any(path.startswith(root) for root in roots):
                 continue
 
-            try:
-                transform = cmdx.encode(path)
+            transform = index.resolve(path)
 
-            except cmdx.ExistError:
+            if transform is None:
                 # Transform wasn't found in this scene, that's OK.
                 # It just means it can't actually be loaded onto anything.
                 missing.append(entity)
                 continue
 
             # Avoid assigning to already assigned transforms
-            if transform in entity_to_transform.values():
+            if transform in claimed:
                 occupied.append(entity)
 
-            elif transform["message"].output(type="rdMarker"):
+            elif index.is_assigned(transform):
                 occupied.append(entity)
 
             entity_to_transform[entity] = transform
-
-        # Re-establish creation order
-        def sort(entity):
-            order = self._registry.get(entity, "OrderComponent")
-            return order["value"]
-
-        markers[:] = sorted(markers, key=sort)
+            claimed.add(transform)
 
     def _pre_process_path(self, path):
         """Apply search-and-replace rules along with namespace changes"""
+        key = (
+            tuple(self._opts["searchAndReplace"]),
+            self._opts["namespace"],
+            self._opts["matchBy"],
+        )
 
-        if not path:
-            return ""
-
-        search, replace = self._opts["searchAndReplace"]
-        search_terms = search.split(" ")
-        replace_terms = replace.split(" ")
-
-        if len(search_terms) > len(replace_terms):
-            for term in search_terms[len(replace_terms):]:
-                replace_terms.append("")
-
-        # Split by space
-        for a, b in zip(search_terms, replace_terms):
-            path = path.replace(a, b)
-
-        # Remove namespace from `path`
-        if self._opts["namespace"] == " ":
-            comps = []
-            for comp in path.split("|"):
-                comp = comp.rsplit(":", 1)[-1]
-                comps.append(comp)
-            path = "|".join(comps)
-
-        # Replace namespace in `path`
-        elif self._opts["namespace"]:
-            namespace = self._opts["namespace"].replace(" ", "")
-
-            # Give namespace-less paths an empty namespace
-            # such that it can be replaced.
-            comps = []
-            for comp in path.split("|"):
-                if ":" not in comp:
-                    comp = ":" + comp
-
-                comp = comp.rsplit(":", 1)[-1]
-                comp = ":%s:%s" % (namespace, comp)
-                comps.append(comp)
-
-            path = "|".join(comps)
-
-        if self._opts["matchBy"] == constants.MatchByName:
-            path = path.rsplit("|", 1)[-1]
+        # Options change with every keystroke in the import dialog,
+        # only those in use are worth remembering
+        if self._rewriter is None or self._rewriter[0] != key:
+            self._rewriter = (key, PathRewriter(*key))
 
-        # In case of double || characters
-        path = path.replace("||", "|")
-
-        # Support wildcard names
-        # E.g. :manikin:L_arm -> :manikin:*L_arm
-        if self._opts["matchBy"] == constants.MatchByName:
-            if ":" in path and "|" not in path:
-                path = "{0}:*{1}".format(*path.rsplit(":", 1))
-
-        return path
+        return self._rewriter[1].rewrite(path)
 
     def _apply_solver(self, mod, entity, solver):
         Solver = self._registry.get(entity, "SolverComponent")
@@ -1457,6 +1931,23 @@ class Loader(object):
         else:
             log.warning("Could not apply unsupported constraint: %s" % con)
 
+    def _mesh_data(self, Meshes, scale):
+        """Return mesh data of `Meshes`, built once per pooled mesh
+
+        Meshes from files without a pool of meshes are built anew.
+
+        """
+
+        if "mesh" not in Meshes:
+            return meshes_to_mobj(Meshes, scale)
+
+        key = (Meshes["mesh"], tuple(scale))
+
+        if key not in self._mesh_cache:
+            self._mesh_cache[key] = meshes_to_mobj(Meshes, scale)
+
+        return self._mesh_cache[key]
+
     def _apply_marker(self, mod, entity, marker):
         Name = self._registry.get(entity, "NameComponent")
         Desc = self._registry.get(entity, "GeometryDescriptionComponent")
@@ -1702,7 +2193,7 @@ class Loader(object):
                 # May be empty
                 if Meshes["vertices"]:
                     Scale = self._registry.get(entity, "ScaleComponent")
-                    mobj = meshes_to_mobj(Meshes, Scale["value"])
+                    mobj = self._mesh_data(Meshes, Scale["value"])
                     mod.set_attr(marker["inputGeometry"], mobj)
 
                     # Matrix is baked into the exported vertices
@@ -1715,33 +2206,31 @@ class Loader(object):
 
 
 def meshes_to_mobj(Meshes, scale=cmdx.Vector(1, 1, 1), parent=None):
-    vertices = cmdx.om.MFloatPointArray()
-    polygon_connects = cmdx.om.MIntArray()
-    polygon_counts = cmdx.om.MIntArray()
-
     # Failsafe
     if any(abs(axis) < 0.0001 for axis in scale):
-        scale.x = max(0.0001, scale.x)
-        scale.y = max(0.0001, scale.y)
-        scale.z = max(0.0001, scale.z)
+        scale = cmdx.Vector(max(0.0001, scale.x),
+                            max(0.0001, scale.y),
+                            max(0.0001, scale.z))
         log.debug("Bad scale during meshes_to_mobj, this is a bug")
 
-    for vertex in Meshes["vertices"][:]:
-        vertex.x /= scale.x
-        vertex.y /= scale.y
-        vertex.z /= scale.z
+    vertices = Meshes["vertices"]
 
-        vertices.append(vertex)
+    if isinstance(vertices, QuantizedPointArray):
+        vertices = vertices.dequantize()
 
-    for index in Meshes["indices"]:
-        polygon_connects.append(index)
+    # Produces a new array, leaving the (cached) original untouched
+    points = vertices / scale
 
-    if len(vertices) == 0:
+    if len(points) == 0:
         return cmdx.om.MObject.kNullObj
 
+    # Triplets are converted to MFloatPoint by Maya itself, in bulk,
+    # as there is no constructing one from a raw buffer
+    vertices = cmdx.om.MFloatPointArray(points.tolist())
+    polygon_connects = cmdx.om.MIntArray(list(Meshes["indices"]))
+
     # It's all triangles, 3 points each
-    for index in range(len(polygon_connects) // 3):
-        polygon_counts.append(3)
+    polygon_counts = cmdx.om.MIntArray(len(polygon_connects) // 3, 3)
 
     mobj = parent
 
@@ -702,12 +702,17 @@ def install_callbacks():
             "ragdollPlanComplete", _on_plan_complete)
     )
 
+    # Let the import dialog know when the scene is worth another look
+    dump.install_callbacks()
+
 
 def uninstall_callbacks():
     for callback_id in __.callbacks:
         om.MMessage.removeCallback(callback_id)
     __.callbacks[:] = []
 
+    dump.uninstall_callbacks()
+
 
 def install_plugin():
     os.environ["XBMLANGPATH"] = os.pathsep.join([
@@ -4246,8 +4251,14 @@ def _import_physics_wrapper():
     })
 
     try:
-        with i__.Timer("importPhysics") as t:
-            _singleton_import_loader.reinterpret()
+        with i__.Timer("importPhysics") as t, progressbar("Importing.. ") as p:
+            def on_progress(step, percent):
+                if p is not None:
+                    cmds.progressBar(p, edit=True,
+                                     status="%s.. " % step,
+                                     progress=int(percent))
+
+            _singleton_import_loader.reinterpret(progress=on_progress)
 
     except Exception:
         log.warning(traceback.format_exc())
@@ -4291,11 +4302,24 @@ def _export_physics_wrapper(thumbnail=None):
             fname = fname.replace("\\", "/")  # Safe for all platforms
 
             try:
-                dump.export(fname, data=data)
+                dump.export(fname, data=data, opts={
+                    "format": options.read("exportFormat"),
+                    "compression": options.read("exportCompression"),
+                    "compact": options.read("exportCompact"),
+                    "pool": options.read("exportPoolMeshes"),
+                    "quantize": options.read("exportQuantize"),
+                    "quantizeError": options.read("exportQuantizeError"),
+                    "base": options.read("exportPatchBase"),
+                })
             except Exception:
                 _print_exception()
                 return log.warning("Could not export %s" % fname)
 
+            # Changes are exported once, rather than every
+            # export from here on silently being a patch too
+            if options.read("exportPatchBase"):
+                options.write("exportPatchBase")
+
             # Update any currently opened Import UI
             for title, widget in __.widgets.items():
                 if not isinstance(widget, ui.ImportOptions):
@@ -0,0 +1,1210 @@
+"""Ragdoll data without Maya
+
+Entities and their components, as read from a .rag file, along with
+validation, summaries and comparisons of them. Used by `dump` to
+recreate a Maya scene, and on its own from the command-line, e.g. on
+machines without Maya.
+
+# Usage Example
+
+$ python -m ragdoll.rag stats character.rag
+$ python -m ragdoll.rag validate assets/*.rag
+$ python -m ragdoll.rag diff character_v001.rag character_v002.rag
+$ python -m ragdoll.rag patch character_v001.rag character_v002.rag
+$ python -m ragdoll.rag extract-thumbnail character.rag -o character.png
+
+# Patches
+
+A patch is a .rag file holding only what changed relative another,
+its base. Added entities are stored whole, changed entities with only
+their changed components, and removed ones listed by name. Reading a
+patch with `read` reads its base and applies the patch on top, and a
+patch may itself be the base of another.
+
+    {
+        "schema": "ragdoll-patch-1.0",
+        "base": {"path": "character_v001.rag", "sha1": "5f0c..."},
+        "header": {"ui": {...}},
+        "added": {"entities": [15]},
+        "removed": {"entities": [12], "components": {"14": ["LodComponent"]}},
+        "entities": {
+            "14": {"components": {"MarkerUIComponent": {...}}},
+            "15": {"components": {...}}
+        },
+        "meshes": {...}
+    }
+
+Entities changed by a patch but since removed from its base are
+skipped, as there is nothing left to apply the change to.
+
+"""
+
+import os
+import sys
+import copy
+import json
+import array
+import base64
+import hashlib
+import logging
+import argparse
+import itertools
+import collections
+
+from . import ragfile
+
+
+try:
+    import numpy
+except ImportError:
+    # Not bundled with every version of Maya
+    numpy = None
+
+try:
+    string_types = (str, unicode)  # noqa
+except NameError:
+    # Python 3 compatibility
+    string_types = (str,)
+
+log = logging.getLogger("ragdoll")
+
+SupportedSchema = "ragdoll-1.0"
+PatchSchema = "ragdoll-patch-1.0"
+
+# Top-level keys of a dump, other than the header
+_Body = ("entities", "meshes", "metadata")
+
+# Components every marker is expected to have, for it to be imported
+MarkerComponents = (
+    "NameComponent",
+    "OrderComponent",
+    "SceneComponent",
+    "GroupComponent",
+    "RigidComponent",
+    "RestComponent",
+    "ScaleComponent",
+    "SubEntitiesComponent",
+    "GeometryDescriptionComponent",
+)
+
+
+class Entity(int):
+    pass
+
+
+def _point(x, y, z):
+    return x, y, z
+
+
+class PointArray(object):
+    """Contiguous buffer of points, stored flat as x, y, z triplets
+
+    Backed by NumPy where available, and the standard `array` module
+    otherwise. Indexing and iterating yields `Point` instances, plain
+    tuples unless overridden, whereas `tolist` and division operate on
+    the buffer as a whole.
+
+    Example:
+        >>> points = PointArray([1, 2, 3, 4, 6, 8])
+        >>> len(points)
+        2
+        >>> (points / (1, 2, 4)).tolist()
+        [(1.0, 1.0, 0.75), (4.0, 3.0, 2.0)]
+
+    """
+
+    # Type of each point, e.g. `cmdx.Point`
+    Point = staticmethod(_point)
+
+    def __init__(self, values=()):
+        if numpy is not None:
+            self._buffer = numpy.array(values, dtype=numpy.float64)
+        else:
+            self._buffer = array.array("d", values)
+
+    def __len__(self):
+        return len(self._buffer) // 3
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("PointArray index out of range")
+
+        return self.Point(*self._buffer[index * 3:index * 3 + 3])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __truediv__(self, scale):
+        """Return a new array with each point divided by `scale`"""
+        result = type(self)()
+
+        if numpy is not None:
+            result._buffer = (
+                self._buffer.reshape(-1, 3) / tuple(scale)
+            ).reshape(-1)
+
+        else:
+            result._buffer = array.array("d", (
+                value / axis for value, axis
+                in zip(self._buffer, itertools.cycle(tuple(scale)))
+            ))
+
+        return result
+
+    __div__ = __truediv__  # Python 2
+
+    def tolist(self):
+        """Return points as a list of (x, y, z) tuples"""
+        buf = self._buffer
+        return list(zip(buf[0::3].tolist(),
+                        buf[1::3].tolist(),
+                        buf[2::3].tolist()))
+
+
+class QuantizedPointArray(object):
+    """Points stored as 16-bit integers within a bounding box
+
+    Decoded on demand via `dequantize`, see `ragfile.quantize`.
+
+    Example:
+        >>> points = QuantizedPointArray([0, 65535, 0], [0, 0, 0, 1, 2, 4])
+        >>> len(points)
+        1
+        >>> points.dequantize().tolist()
+        [(0.0, 2.0, 0.0)]
+
+    """
+
+    # Type of dequantized arrays
+    PointArray = PointArray
+
+    def __init__(self, values, bounds):
+        self._values = values
+        self._minimum = tuple(bounds[:3])
+        self._maximum = tuple(bounds[3:])
+
+    def __len__(self):
+        return len(self._values) // 3
+
+    def dequantize(self):
+        """Return a new PointArray of the original, full-precision points"""
+        steps = tuple(
+            (high - low) / ragfile.QuantizedSteps
+            for low, high in zip(self._minimum, self._maximum)
+        )
+
+        result = self.PointArray()
+
+        if numpy is not None:
+            values = numpy.array(self._values, dtype=numpy.float64)
+            result._buffer = (
+                values.reshape(-1, 3) * steps + self._minimum
+            ).reshape(-1)
+
+        else:
+            result._buffer = array.array("d", (
+                low + value * step for value, low, step in zip(
+                    self._values,
+                    itertools.cycle(self._minimum),
+                    itertools.cycle(steps)
+                )
+            ))
+
+        return result
+
+
+# Type of each converted member, by the type it was stored as.
+# Plain tuples by default, see `dump.Registry` for Maya's types.
+Types = {
+    "Vector3": tuple,
+    "Color4": tuple,
+    "Matrix44": tuple,
+    "Quaternion": tuple,
+    "PointArray": PointArray,
+    "QuantizedPointArray": QuantizedPointArray,
+}
+
+
+def _value_to_type(value, types=None):
+    types = types or Types
+
+    if isinstance(value, (list, tuple)):
+        value = [_value_to_type(v, types) for v in value]
+
+    elif not isinstance(value, dict):
+        pass
+
+    elif value["type"] == "Entity":
+        value = Entity(value["value"])
+
+    elif value["type"] == "Vector3":
+        value = types["Vector3"](value["values"])
+
+    elif value["type"] == "Color4":
+        value = types["Color4"](value["values"])
+
+    elif value["type"] == "Matrix44":
+        value = types["Matrix44"](value["values"])
+
+    elif value["type"] == "Path":
+        value = value["value"]
+
+    elif value["type"] == "Mesh":
+        # Key into the pool of meshes, see `Registry.mesh`
+        value = value["value"]
+
+    elif value["type"] == "Quaternion":
+        value = types["Quaternion"](value["values"])
+
+    elif value["type"] == "PointArray":
+        # Values are stored flat; every 3 values represent an Point
+        value = types["PointArray"](value["values"])
+
+    elif value["type"] == "UintArray":
+        value = array.array("I", value["values"])
+
+    elif value["type"] == "QuantizedPointArray":
+        value = types["QuantizedPointArray"](value["values"],
+                                              value["bounds"])
+
+    else:
+        raise TypeError("Unsupported type: %s" % value)
+
+    return value
+
+
+def Component(comp, types=None):
+    """Simplified access to component members"""
+
+    data = {}
+
+    for key, value in comp["members"].items():
+        if isinstance(value, (dict, list, tuple)):
+            value = _value_to_type(value, types)
+
+        data[key] = value
+
+    return data
+
+
+class Registry(object):
+    """Entities and their components, as read from a Ragdoll dump
+
+    Arguments:
+        dump (dict, optional): Parsed dump, e.g. from a .rag file
+        copy_on_write (bool, optional): Wrap `dump` rather than
+            taking a deep copy of it. Components are then shared with
+            `dump` until modified via `emplace` or `erase`, at which
+            point only the affected entity is cloned.
+
+    """
+
+    # Maximum number of converted components kept around by `get`
+    CacheSize = 10000
+
+    # Types of converted members, see `Types`
+    Types = Types
+
+    def __init__(self, dump=None, copy_on_write=False):
+        if dump is None:
+            dump = {
+                "entities": {}
+            }
+
+        if copy_on_write:
+            dump = dict(dump)
+        else:
+            dump = copy.deepcopy(dump)
+
+        dump["entities"] = {
+
+            # Original JSON stores keys as strings, but the original
+            # keys are integers; i.e. entity IDs
+            Entity(entity): value
+            for entity, value in dump["entities"].items()
+        }
+
+        self._dump = dump
+
+        # Entities still sharing their components with the original dump
+        self._shared = set(dump["entities"]) if copy_on_write else set()
+
+        # Map component name -> entities with that component
+        #
+        # Entities are stored as keys of a dictionary rather than
+        # a set, such that views preserve the order of the dump.
+        #
+        self._index = {}
+
+        for entity, value in dump["entities"].items():
+            for component in value["components"]:
+                self._index.setdefault(component, {})[entity] = True
+
+        # Map (entity, component name) -> converted component,
+        # in order of least to most recently used
+        self._cache = collections.OrderedDict()
+
+        # Map key -> converted mesh, shared by every entity using it
+        self._meshes = {}
+
+    def count(self, *components):
+        """Return number of entities with this component(s)"""
+        if len(components) == 1:
+            return len(self._index.get(components[0], {}))
+
+        return len(list(self.view(*components)))
+
+    def view(self, *components):
+        """Iterate over every entity that has all of `components`"""
+        if not components:
+            for entity in list(self._dump["entities"]):
+                yield entity
+
+            return
+
+        pools = [self._index.get(comp, {}) for comp in components]
+        pools.sort(key=len)
+
+        # Walk the smallest pool, and look the rest up
+        smallest, others = pools[0], pools[1:]
+
+        for entity in list(smallest):
+            if all(entity in pool for pool in others):
+                yield entity
+
+    def create(self, entity, components=None):
+        """Add `entity` with optional `components` to the registry
+
+        Arguments:
+            entity (int): Entity ID, replacing any existing entity
+            components (dict, optional): Name -> component pairs
+
+        """
+
+        entity = Entity(entity)
+
+        if entity in self._dump["entities"]:
+            self.destroy(entity)
+
+        self._dump["entities"][entity] = {"components": {}}
+
+        for name, component in (components or {}).items():
+            self.emplace(entity, name, component)
+
+        return entity
+
+    def destroy(self, entity):
+        """Remove `entity` and all of its components"""
+        for name in self.components(entity):
+            self._index[name].pop(entity)
+
+            if not self._index[name]:
+                self._index.pop(name)
+
+        self._dump["entities"].pop(entity)
+        self._shared.discard(entity)
+        self._uncache(entity)
+
+    def emplace(self, entity, name, component):
+        """Assign `component` to `entity`, replacing any existing one"""
+        self._writable(entity)[name] = component
+        self._index.setdefault(name, {})[entity] = True
+        self._uncache(entity, name)
+
+    def erase(self, entity, name):
+        """Remove component `name` from `entity`"""
+        self._writable(entity).pop(name)
+        self._index[name].pop(entity)
+        self._uncache(entity, name)
+
+        if not self._index[name]:
+            self._index.pop(name)
+
+    def _writable(self, entity):
+        """Return components of `entity`, safe for modification"""
+        if entity in self._shared:
+            value = self._dump["entities"][entity]
+            value = dict(value, components=dict(value["components"]))
+            self._dump["entities"][entity] = value
+            self._shared.discard(entity)
+
+        return self._dump["entities"][entity]["components"]
+
+    def _uncache(self, entity, name=None):
+        """Forget converted components of `entity`"""
+        names = [name] if name else [
+            key[1] for key in self._cache if key[0] == entity
+        ]
+
+        for name in names:
+            self._cache.pop((entity, name), None)
+
+    def has(self, entity, component):
+        """Return whether `entity` has `component`"""
+        assert isinstance(entity, int), "entity must be int"
+        assert isinstance(component, string_types), (
+            "component must be string")
+        return component in self._dump["entities"][entity]["components"]
+
+    def get(self, entity, component):
+        """Return `component` for `entity`
+
+        Converted components are cached, such that repeated calls
+        for the same `entity` and `component` are cheap. Members are
+        shared between calls and must not be modified in-place.
+
+        Returns:
+            dict: The component
+
+        Raises:
+            KeyError: if `entity` does not have `component`
+
+        Example:
+            >>> registry = Registry({"entities": {"1": {"components": {
+            ...     "NameComponent": {"members": {"value": "arm"}}
+            ... }}}})
+            >>> registry.get(1, "NameComponent")
+            {'value': 'arm'}
+
+        """
+
+        key = (entity, component)
+
+        try:
+            data = self._cache.pop(key)
+
+        except KeyError:
+            pass
+
+        else:
+            self._cache[key] = data
+            return dict(data)
+
+        try:
+            components = self._dump["entities"][entity]["components"]
+            data = Component(components[component], self.Types)
+
+            if component == "ConvexMeshComponents" and "mesh" in data:
+                data.update(self.mesh(data["mesh"]))
+
+        except KeyError as e:
+            if self.has(entity, "NameComponent"):
+                Name = self.get(entity, "NameComponent")
+                name = Name["path"] or Name["value"]
+            else:
+                name = "Entity: %d" % entity
+
+            raise KeyError("%s did not have '%s' (%s) {%s}" % (
+                name, component, e, ", ".join(components.keys()))
+            )
+
+        self._cache[key] = data
+
+        while len(self._cache) > self.CacheSize:
+            self._cache.popitem(last=False)
+
+        return dict(data)
+
+    def mesh(self, key):
+        """Return vertices and indices of pooled mesh `key`
+
+        Identical meshes are stored once per dump, and referenced
+        by key from each ConvexMeshComponents. The returned members
+        are shared and must not be modified in-place.
+
+        """
+
+        if key not in self._meshes:
+            members = self._dump["meshes"][key]
+            self._meshes[key] = Component({"members": members},
+                                          self.Types)
+
+        return dict(self._meshes[key])
+
+    def components(self, entity):
+        """Return *all* components for `entity`
+
+        These may be shared with the original dump, use `emplace`
+        and `erase` rather than modifying them directly.
+
+        """
+
+        return self._dump["entities"][entity]["components"]
+
+
+def _references(value):
+    """Return every entity referenced by member `value`"""
+    if isinstance(value, (list, tuple)):
+        return [
+            entity for item in value
+            for entity in _references(item)
+        ]
+
+    if isinstance(value, dict) and value.get("type") == "Entity":
+        return [value["value"]]
+
+    return []
+
+
+def label(registry, entity):
+    """Return a human-readable name for `entity`"""
+    if registry.has(entity, "NameComponent"):
+        Name = registry.get(entity, "NameComponent")
+        return Name["path"] or Name["value"] or "Entity: %d" % entity
+
+    return "Entity: %d" % entity
+
+
+def validate(data, strict=False):
+    """Return reasons `data` could not be imported, if any
+
+    Arguments:
+        data (dict): Parsed dump, e.g. from `ragfile.read`
+        strict (bool, optional): Also consider references to
+            entities not part of `data`, which are otherwise ignored
+
+    Example:
+        >>> validate({"schema": "ragdoll-1.0", "entities": {}})
+        []
+        >>> validate({"schema": "ragdoll-0.1", "entities": {}})
+        ['Unsupported schema: ragdoll-0.1']
+
+    """
+
+    reasons = []
+
+    if data.get("schema") != SupportedSchema:
+        reasons.append("Unsupported schema: %s" % data.get("schema"))
+
+    if not isinstance(data.get("entities"), dict):
+        reasons.append("No entities")
+        return reasons
+
+    registry = Registry(data, copy_on_write=True)
+    entities = set(registry.view())
+
+    for entity in entities:
+        components = registry.components(entity)
+
+        for name in components:
+            try:
+                registry.get(entity, name)
+
+            except (KeyError, TypeError, ValueError) as e:
+                reasons.append("%s.%s could not be read: %s" % (
+                    label(registry, entity), name, e
+                ))
+
+                continue
+
+            if not strict:
+                continue
+
+            for member, value in components[name]["members"].items():
+                for reference in _references(value):
+
+                    # Null references are fine
+                    if reference and reference not in entities:
+                        reasons.append(
+                            "%s.%s.%s refers to missing entity %d" % (
+                                label(registry, entity), name, member,
+                                reference
+                            )
+                        )
+
+    for entity in registry.view("MarkerUIComponent"):
+        missing = [
+            name for name in MarkerComponents
+            if not registry.has(entity, name)
+        ]
+
+        if missing:
+            reasons.append("%s is missing %s" % (
+                label(registry, entity), ", ".join(missing)
+            ))
+
+    return reasons
+
+
+def stats(data):
+    """Return a summary of `data`, like `Loader.report` without Maya
+
+    Example:
+        >>> stats({"schema": "ragdoll-1.0", "entities": {}})["markers"]
+        0
+
+    """
+
+    registry = Registry(data, copy_on_write=True)
+
+    solver_to_markers = collections.defaultdict(int)
+    group_to_markers = collections.defaultdict(int)
+
+    for entity in registry.view("MarkerUIComponent"):
+        Scene = registry.get(entity, "SceneComponent")
+        Group = registry.get(entity, "GroupComponent")
+        solver_to_markers[Scene["entity"]] += 1
+        group_to_markers[Group["entity"]] += 1
+
+    constraints = sum(
+        registry.count(component) for component in (
+            "DistanceJointUIComponent",
+            "PinJointUIComponent",
+            "FixedJointComponent",
+        )
+    )
+
+    counts = collections.Counter()
+    for entity in registry.view():
+        for name in registry.components(entity):
+            counts[name] += 1
+
+    return {
+        "schema": data.get("schema"),
+        "info": data.get("info", {}),
+        "entities": registry.count(),
+        "components": dict(counts),
+        "solvers": [
+            {"name": label(registry, entity),
+             "markers": solver_to_markers[entity]}
+            for entity in registry.view("SolverUIComponent")
+        ],
+        "groups": [
+            {"name": label(registry, entity),
+             "markers": group_to_markers[entity]}
+            for entity in registry.view("GroupUIComponent")
+        ],
+        "markers": registry.count("MarkerUIComponent"),
+        "constraints": constraints,
+        "collisionGroups": registry.count("CollisionGroupComponent"),
+        "meshes": len(data.get("meshes") or {}),
+    }
+
+
+def _members(data, component):
+    """Return members of `component`, with any pooled mesh inlined"""
+    members = component["members"]
+
+    if "mesh" in members:
+        members = dict(members)
+        key = members.pop("mesh")["value"]
+        members.update(data["meshes"][key])
+
+    return members
+
+
+def diff(a, b):
+    """Return the entities and components that differ from `a` to `b`
+
+    Entities are compared by ID, components member by member.
+
+    Returns:
+        dict: Added and removed entities, and for every changed
+            entity its added, removed and changed components, along
+            with the names of the members that changed.
+
+    Example:
+        >>> a = {"entities": {"1": {"components": {}}}}
+        >>> b = {"entities": {"2": {"components": {}}}}
+        >>> diff(a, b)["added"], diff(a, b)["removed"]
+        ([2], [1])
+
+    """
+
+    a_entities = {
+        Entity(entity): value for entity, value in a["entities"].items()
+    }
+
+    b_entities = {
+        Entity(entity): value for entity, value in b["entities"].items()
+    }
+
+    result = {
+        "added": sorted(set(b_entities) - set(a_entities)),
+        "removed": sorted(set(a_entities) - set(b_entities)),
+        "changed": {},
+    }
+
+    for entity in sorted(set(a_entities) & set(b_entities)):
+        a_components = a_entities[entity]["components"]
+        b_components = b_entities[entity]["components"]
+
+        changes = {
+            "added": sorted(set(b_components) - set(a_components)),
+            "removed": sorted(set(a_components) - set(b_components)),
+            "changed": {},
+        }
+
+        for name in sorted(set(a_components) & set(b_components)):
+            a_members = _members(a, a_components[name])
+            b_members = _members(b, b_components[name])
+
+            if a_members == b_members:
+                continue
+
+            changes["changed"][name] = sorted(
+                member for member in set(a_members) | set(b_members)
+                if a_members.get(member) != b_members.get(member)
+            )
+
+        if any(changes.values()):
+            result["changed"][entity] = changes
+
+    return result
+
+
+def make_patch(base, data):
+    """Return the difference from `base` to `data`, as a patch
+
+    See `apply_patch` for the opposite.
+
+    Arguments:
+        base (dict): Parsed dump
+        data (dict): Parsed dump, e.g. a later revision of `base`
+
+    Example:
+        >>> a = {"entities": {"1": {"components": {}}}}
+        >>> b = {"entities": {"2": {"components": {}}}}
+        >>> patch = make_patch(a, b)
+        >>> patch["removed"]["entities"], list(patch["entities"])
+        ([1], ['2'])
+        >>> apply_patch(a, patch) == b
+        True
+
+    """
+
+    # Identical meshes share a key, such that they compare cheaply
+    base = ragfile.pool_meshes(base)
+    data = ragfile.pool_meshes(data)
+
+    base_entities = {
+        Entity(entity): value for entity, value in base["entities"].items()
+    }
+
+    patch = {
+        "schema": PatchSchema,
+        "header": {},
+        "added": {
+            "entities": [],
+        },
+        "removed": {
+            "header": [],
+            "entities": [],
+            "components": {},
+        },
+        "entities": {},
+        "meshes": {},
+    }
+
+    for key, value in data.items():
+        if key not in _Body and base.get(key, None) != value:
+            patch["header"][key] = value
+
+    patch["removed"]["header"] = sorted(
+        key for key in base if key not in _Body and key not in data
+    )
+
+    entities = set()
+
+    for entity, value in data["entities"].items():
+        entity = Entity(entity)
+        entities.add(entity)
+
+        if entity not in base_entities:
+            patch["entities"][str(entity)] = value
+            patch["added"]["entities"].append(entity)
+            continue
+
+        base_components = base_entities[entity]["components"]
+        components = value["components"]
+
+        changed = {
+            name: component for name, component in components.items()
+            if name not in base_components
+            or base_components[name] != component
+        }
+
+        removed = sorted(
+            name for name in base_components if name not in components
+        )
+
+        if changed:
+            patch["entities"][str(entity)] = {"components": changed}
+
+        if removed:
+            patch["removed"]["components"][str(entity)] = removed
+
+    patch["added"]["entities"].sort()
+    patch["removed"]["entities"] = sorted(set(base_entities) - entities)
+
+    # Include meshes of every changed ConvexMeshComponents
+    for value in patch["entities"].values():
+        component = value["components"].get("ConvexMeshComponents")
+
+        if component and "mesh" in component["members"]:
+            key = component["members"]["mesh"]["value"]
+            patch["meshes"][key] = data["meshes"][key]
+
+    return patch
+
+
+def apply_patch(base, patch):
+    """Return `base` with `patch` applied, without modifying `base`
+
+    Only entities touched by `patch` are read, others are shared
+    with `base` as-is.
+
+    Arguments:
+        base (dict): Parsed dump
+        patch (dict): Patch from `make_patch`
+
+    """
+
+    data = dict(base)
+    data.pop("metadata", None)
+    data.update(patch["header"])
+
+    for key in patch["removed"]["header"]:
+        data.pop(key, None)
+
+    # Entities are stored as strings, but compared as integers
+    keys = {Entity(entity): entity for entity in base["entities"]}
+    entities = dict(base["entities"])
+
+    for entity in patch["removed"]["entities"]:
+        entities.pop(keys.get(Entity(entity)), None)
+
+    for entity, names in patch["removed"]["components"].items():
+        key = keys.get(Entity(entity))
+
+        if key not in entities:
+            # The base has changed since the patch was made
+            log.warning(
+                "Entity %s is no longer in the base file, skipping" % entity
+            )
+            continue
+
+        value = entities[key]
+        components = dict(value["components"])
+
+        for name in names:
+            components.pop(name, None)
+
+        entities[key] = dict(value, components=components)
+
+    added = set(Entity(entity) for entity in patch["added"]["entities"])
+
+    for entity, value in patch["entities"].items():
+        key = keys.get(Entity(entity), entity)
+
+        if Entity(entity) in added:
+            entities[key] = value
+            continue
+
+        if key not in entities:
+            # Only the changed components are in the patch
+            log.warning(
+                "Entity %s is no longer in the base file, skipping" % entity
+            )
+            continue
+
+        existing = entities[key]
+        components = dict(existing["components"])
+        components.update(value["components"])
+        entities[key] = dict(existing, components=components)
+
+    data["entities"] = entities
+
+    if patch.get("meshes"):
+        meshes = dict(base.get("meshes") or {})
+        meshes.update(patch["meshes"])
+        data["meshes"] = meshes
+
+    return data
+
+
+# Patches and bases already compared, by their state on disk, see `read`
+_compared = set()
+
+
+def _sha1(fname):
+    sha1 = hashlib.sha1()
+
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+
+def read(fname, indexed=True, cached=False):
+    """Return the contents of .rag file `fname`, applying any patch
+
+    Arguments:
+        fname (str): Absolute path to .rag file
+        indexed (bool, optional): See `ragfile.read`
+        cached (bool, optional): See `ragfile.read`
+
+    """
+
+    data = ragfile.read(fname, indexed=indexed, cached=cached)
+
+    if data.get("schema") != PatchSchema:
+        return data
+
+    base = data["base"]
+    base_fname = os.path.join(os.path.dirname(fname), base["path"])
+
+    # Hashing is as costly as reading the base in full,
+    # so only do it the first time the patch is read
+    key = (ragfile.ReadCache.key(fname), ragfile.ReadCache.key(base_fname))
+
+    if key not in _compared:
+        if _sha1(base_fname) != base["sha1"]:
+            log.warning(
+                "%s has changed since %s was exported, "
+                "the result may not be what you expect" % (base_fname, fname)
+            )
+
+        if len(_compared) > 1000:
+            _compared.clear()
+
+        _compared.add(key)
+
+    return apply_patch(read(base_fname, indexed, cached), data)
+
+
+def write_patch(fname, base_fname, data, opts=None):
+    """Write `data` to `fname` as a patch on top of `base_fname`
+
+    The metadata of `fname` is that of the full `data`, such that
+    it previews like any other file.
+
+    Arguments:
+        fname (str): Absolute path to destination .rag file
+        base_fname (str): Absolute path to a previously written file
+        data (dict): Dump, e.g. from `cmds.ragdollDump()`
+        opts (dict, optional): Options, see `ragfile.write`
+
+    Returns:
+        patch (dict): What was written
+
+    """
+
+    assert os.path.normcase(os.path.abspath(fname)) != (
+        os.path.normcase(os.path.abspath(base_fname))
+    ), "%s cannot be a patch of itself" % fname
+
+    patch = make_patch(read(base_fname, cached=True), data)
+
+    # Relative, to survive moving both files elsewhere
+    patch["base"] = {
+        "path": os.path.relpath(os.path.abspath(base_fname),
+                                os.path.dirname(os.path.abspath(fname))),
+        "sha1": _sha1(base_fname),
+    }
+
+    ragfile.write(fname, patch, dict(opts or {},
+                                     metadata=ragfile.summarise(data)))
+
+    return patch
+
+
+def extract_thumbnail(fname):
+    """Return thumbnail of .rag file `fname` as PNG, or None
+
+    Example:
+        >>> png = extract_thumbnail("character.rag")  # doctest: +SKIP
+        >>> png[:4]  # doctest: +SKIP
+        b'\\x89PNG'
+
+    """
+
+    metadata = ragfile.read_metadata(fname)
+    thumbnail = metadata.get("thumbnail")
+
+    if not thumbnail:
+        return None
+
+    return base64.b64decode(thumbnail)
+
+
+def _write(text=""):
+    sys.stdout.write(text + "\n")
+
+
+def _stats_command(args):
+    results = {}
+
+    for fname in args.files:
+        results[fname] = stats(read(fname, indexed=False))
+
+    if args.json:
+        return _write(json.dumps(results, indent=4, sort_keys=True))
+
+    for fname, result in results.items():
+        _write("%s (%s)" % (fname, result["schema"]))
+        _write("  Entities: %d" % result["entities"])
+        _write("  Markers: %d" % result["markers"])
+        _write("  Constraints: %d" % result["constraints"])
+        _write("  Collision Groups: %d" % result["collisionGroups"])
+        _write("  Pooled Meshes: %d" % result["meshes"])
+
+        for key, title in (("solvers", "Solvers"), ("groups", "Groups")):
+            if result[key]:
+                _write("  %s:" % title)
+
+            for item in result[key]:
+                _write("    %s.. (%d markers)" % (
+                    item["name"], item["markers"]
+                ))
+
+        if args.verbose:
+            _write("  Components:")
+
+            for name, count in sorted(result["components"].items()):
+                _write("    %s: %d" % (name, count))
+
+
+def _validate_command(args):
+    results = {}
+
+    for fname in args.files:
+        try:
+            data = read(fname, indexed=False)
+            results[fname] = validate(data, strict=args.strict)
+
+        except Exception as e:
+            results[fname] = ["Could not be read: %s" % e]
+
+    if args.json:
+        _write(json.dumps(results, indent=4, sort_keys=True))
+
+    else:
+        for fname, reasons in results.items():
+            _write("%s: %s" % (fname, "invalid" if reasons else "ok"))
+
+            for reason in reasons:
+                _write("  %s" % reason)
+
+    return 1 if any(results.values()) else 0
+
+
+def _diff_command(args):
+    a = read(args.a, indexed=False)
+    b = read(args.b, indexed=False)
+    result = diff(a, b)
+
+    if args.json:
+        _write(json.dumps(result, indent=4, sort_keys=True))
+
+    else:
+        a_registry = Registry(a, copy_on_write=True)
+        b_registry = Registry(b, copy_on_write=True)
+
+        for entity in result["removed"]:
+            _write("- %s" % label(a_registry, entity))
+
+        for entity in result["added"]:
+            _write("+ %s" % label(b_registry, entity))
+
+        for entity, changes in sorted(result["changed"].items()):
+            _write("~ %s" % label(b_registry, entity))
+
+            for name in changes["removed"]:
+                _write("    - %s" % name)
+
+            for name in changes["added"]:
+                _write("    + %s" % name)
+
+            for name, members in sorted(changes["changed"].items()):
+                _write("    ~ %s: %s" % (name, ", ".join(members)))
+
+    return 1 if any(result.values()) else 0
+
+
+def _patch_command(args):
+    output = args.output or "%s.patch.rag" % os.path.splitext(args.b)[0]
+    patch = write_patch(output, args.a, read(args.b, indexed=False))
+
+    _write("%s (%d bytes, %d entities changed, %d removed)" % (
+        output,
+        os.path.getsize(output),
+        len(patch["entities"]),
+        len(patch["removed"]["entities"]),
+    ))
+
+
+def _extract_thumbnail_command(args):
+    png = extract_thumbnail(args.file)
+
+    if png is None:
+        log.error("%s has no thumbnail" % args.file)
+        return 1
+
+    output = args.output or os.path.splitext(args.file)[0] + ".png"
+
+    with open(output, "wb") as f:
+        f.write(png)
+
+    _write(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ragdoll.rag",
+        description="Inspect .rag files, without Maya"
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    sub = subparsers.add_parser("stats", help="Summarise file(s)")
+    sub.add_argument("files", nargs="+")
+    sub.add_argument("--json", action="store_true")
+    sub.add_argument("--verbose", action="store_true",
+                     help="Include count of each component")
+    sub.set_defaults(func=_stats_command)
+
+    sub = subparsers.add_parser("validate", help="Check file(s) for errors")
+    sub.add_argument("files", nargs="+")
+    sub.add_argument("--json", action="store_true")
+    sub.add_argument("--strict", action="store_true",
+                     help="Also report references to missing entities")
+    sub.set_defaults(func=_validate_command)
+
+    sub = subparsers.add_parser("diff", help="Compare two files")
+    sub.add_argument("a")
+    sub.add_argument("b")
+    sub.add_argument("--json", action="store_true")
+    sub.set_defaults(func=_diff_command)
+
+    sub = subparsers.add_parser("patch",
+                                help="Write changes from one file to another")
+    sub.add_argument("a", help="Base file")
+    sub.add_argument("b", help="Changed file")
+    sub.add_argument("-o", "--output",
+                     help="Defaults to the changed file, with a "
+                          ".patch.rag suffix")
+    sub.set_defaults(func=_patch_command)
+
+    sub = subparsers.add_parser("extract-thumbnail",
+                                help="Write thumbnail of file as PNG")
+    sub.add_argument("file")
+    sub.add_argument("-o", "--output",
+                     help="Defaults to the file, with a .png suffix")
+    sub.set_defaults(func=_extract_thumbnail_command)
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(message)s")
+
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1603 @@
+"""Reading and writing of .rag files
+
+A .rag file is either plain JSON - the original format - or a binary
+container of the very same data, either of which may be compressed with
+gzip or lzma. All are read with `read` and written with `write`, the
+format and compression are detected from the first few bytes of a file.
+
+This module does not depend on Maya.
+
+# Binary Layout
+
+ ____________________________________________________
+|                                                    |
+| Preamble   magic, version, header and toc sizes    |
+|____________________________________________________|
+|                                                    |
+| Header     JSON; everything but the entities,      |
+|            e.g. schema, info and ui/thumbnail      |
+|____________________________________________________|
+|                                                    |
+| Contents   JSON; every entity with the names of    |
+|            its components, and the offset and size |
+|            of each component block                 |
+|____________________________________________________|
+|                                                    |
+| Blocks     One per component type, e.g. all        |
+|            ConvexMeshComponents, stored column by  |
+|            column. Matrices, vectors and mesh      |
+|            buffers are stored as raw numbers, the  |
+|            remainder as JSON.                      |
+|____________________________________________________|
+
+Blocks are read on first access of any of its components, such that
+e.g. convex meshes aren't decoded unless actually used.
+
+# Mesh Pool
+
+Optionally, convex meshes are stored once per unique mesh, in a top-level
+"meshes" table keyed by a hash of their vertices and indices. Mirrored
+limbs and duplicated characters then share the same entry, which each
+ConvexMeshComponents refers to by key. Builds of Ragdoll prior to the
+pool cannot read pooled files, so meshes are only pooled when asked.
+
+    "meshes": {
+        "3f786850e387550fdab836ed7e6dc881de23001b": {
+            "indices": {"type": "UintArray", "values": [...]},
+            "vertices": {"type": "PointArray", "values": [...]}
+        }
+    }
+
+    "ConvexMeshComponents": {
+        "members": {
+            "mesh": {
+                "type": "Mesh",
+                "value": "3f786850e387550fdab836ed7e6dc881de23001b"
+            }
+        },
+        "type": "ConvexMeshComponents"
+    }
+
+In binary files, the table is stored as a block of its own.
+
+# Quantized Meshes
+
+Optionally, vertices of pooled meshes are stored as 16-bit integers
+relative to the bounding box of each mesh, given a maximum error.
+Meshes too large for that error are kept at full precision.
+
+    "vertices": {
+        "type": "QuantizedPointArray",
+        "bounds": [-1.0, 0.0, -1.0, 1.0, 2.0, 1.0],
+        "values": [0, 65535, 32768, ...]
+    }
+
+A value v along an axis then translates to min + v * (max - min) / 65535.
+
+# Metadata
+
+Every file starts with a small block of metadata - name, tags,
+thumbnail, component counts and info - such that e.g. the asset
+library can preview a file without reading the rest of it. In JSON
+files, it's the first key and first line of the file. In binary files,
+it's part of the header.
+
+    {"metadata": {"counts": {...}, "info": {...}, "thumbnail": "..."},
+        "entities": {
+            ...
+
+# Indexed JSON
+
+Plain JSON files are indexed the first time they are read, recording
+the byte offsets of each component of each entity. The index is stored
+alongside other user data in ~/.ragdoll/index, and later reads of an
+unmodified file use it to read components on demand, like binary files.
+Indices of files that no longer exist are removed, along with the least
+recently used once over budget; $RAGDOLL_INDEX_CACHE megabytes by default.
+
+Files read on demand are expected to stay as they were when first read.
+Reading a component of a file that has since changed raises an IOError,
+read the file anew instead.
+
+# Read Cache
+
+Files read with `cached=True` are kept in memory for the lifetime of
+the process, such that the import dialog, asset library and final
+import of a file share one parse of it. Entries are keyed by path,
+modification time and size, and the least recently used are evicted
+once over budget; $RAGDOLL_READ_CACHE megabytes by default.
+
+"""
+
+import io
+import os
+import re
+import sys
+import copy
+import gzip
+import json
+import array
+import errno
+import base64
+import struct
+import hashlib
+import logging
+import functools
+import threading
+import collections
+
+from . import constants
+
+try:
+    import lzma
+except ImportError:
+    # Python 2 has no lzma, but can still read and write gzip
+    lzma = None
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping  # py2
+
+try:
+    _integer_types = (int, long)  # noqa
+    _string_types = (str, unicode)  # noqa
+except NameError:
+    # Python 3 compatibility
+    _integer_types = (int,)
+    _string_types = (str,)
+
+log = logging.getLogger("ragdoll")
+
+BinaryMagic = b"\x89RAG\r\n\x1a\n"
+GzipMagic = b"\x1f\x8b"
+LzmaMagic = b"\xfd7zXZ\x00"
+
+# Magic, major version, minor version, header size, contents size
+_Preamble = struct.Struct("<8sHHII")
+_BlockPreamble = struct.Struct("<I")
+
+# Bump whenever the layout of sidecar indices change
+IndexVersion = 3
+IndexDirectory = os.path.expanduser("~/.ragdoll/index")
+IndexBudget = constants.RAGDOLL_INDEX_CACHE * 1024 ** 2
+
+# Bytes of indices written since they were last pruned, see `_write_index`
+_unpruned = None
+
+# Every JSON file written with metadata starts with this
+_MetadataPrefix = b'{"metadata": '
+
+_Whitespace = re.compile(r"[ \t\n\r]*")
+
+# Typed members stored as raw numbers, and the typecode for their values
+_FloatTypes = ("Matrix44", "Vector3", "Color4", "Quaternion", "PointArray")
+_VariableTypes = ("PointArray", "UintArray", "QuantizedPointArray")
+_Typecodes = {"UintArray": "I", "QuantizedPointArray": "H"}
+_Limits = {"UintArray": 2 ** 32, "QuantizedPointArray": 2 ** 16}
+
+# Number of steps per axis of quantized vertices
+QuantizedSteps = 2 ** 16 - 1
+
+
+def _to_bytes(arr):
+    if sys.byteorder == "big":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+
+    try:
+        return arr.tobytes()
+    except AttributeError:
+        return arr.tostring()  # py2
+
+
+def _from_bytes(typecode, data):
+    arr = array.array(typecode)
+
+    try:
+        arr.frombytes(data)
+    except AttributeError:
+        arr.fromstring(data)  # py2
+
+    if sys.byteorder == "big":
+        arr.byteswap()
+
+    return arr
+
+
+def _compression(fname):
+    """Return compression of `fname`, from its first few bytes"""
+    with open(fname, "rb") as f:
+        magic = f.read(len(LzmaMagic))
+
+    if magic.startswith(GzipMagic):
+        return constants.CompressionGzip
+
+    if magic.startswith(LzmaMagic):
+        return constants.CompressionLzma
+
+    return constants.CompressionOff
+
+
+def _open(fname, mode="rb", compression=None):
+    """Open `fname` for binary reading or writing, with `compression`
+
+    The compression of files opened for reading is detected.
+
+    """
+
+    if compression is None:
+        compression = _compression(fname)
+
+    if compression == constants.CompressionGzip:
+        return gzip.open(fname, mode)
+
+    if compression == constants.CompressionLzma:
+        if lzma is None:
+            raise IOError("lzma is not supported by this Python: %s" % fname)
+
+        return lzma.open(fname, mode)
+
+    return open(fname, mode)
+
+
+def is_compressed(fname):
+    """Return whether `fname` is compressed"""
+    return _compression(fname) != constants.CompressionOff
+
+
+def is_binary(fname):
+    """Return whether `fname` is a binary .rag file, compressed or not"""
+    with _open(fname) as f:
+        return f.read(len(BinaryMagic)) == BinaryMagic
+
+
+def read(fname, indexed=True, cached=False):
+    """Return the contents of .rag file `fname`
+
+    Binary files are read lazily; entities are available immediately,
+    but the components themselves are read on first access. The same
+    goes for plain JSON files that have previously been indexed.
+
+    Arguments:
+        fname (str): Absolute path to .rag file
+        indexed (bool, optional): Index plain JSON files on first read,
+            and use that index to read components on demand thereafter
+        cached (bool, optional): Return the same data as a previous
+            read of this file, if it hasn't changed since, see `cache`.
+            The data is then shared and must not be modified.
+
+    """
+
+    if not cached:
+        return _read(fname, indexed)[0]
+
+    key = cache.key(fname)
+    data = cache.get(key)
+
+    if data is None:
+        data, size = _read(fname, indexed)
+        cache.put(key, data, size)
+
+    return data
+
+
+def _read(fname, indexed):
+    """Return contents of `fname` along with its size in memory
+
+    The size is that of the uncompressed file, which is roughly
+    what the data will occupy once fully read.
+
+    """
+
+    compressed = is_compressed(fname)
+
+    with _open(fname) as f:
+        if f.read(len(BinaryMagic)) == BinaryMagic:
+            reader = BinaryReader(fname)
+            return reader.dump(), reader.size()
+
+    indexed = indexed and not compressed
+
+    if indexed:
+        # An indexed file is never read as a whole
+        index = _read_index(fname)
+
+        if index is not None:
+            try:
+                return IndexedReader(fname, index).dump(), index["size"]
+
+            except (KeyError, TypeError, ValueError, IndexError):
+                # Corrupt, read it as though it was never indexed
+                log.debug("Could not use index of %s" % fname)
+
+    with _open(fname) as f:
+        content = f.read()
+
+    if not indexed:
+        return json.loads(content.decode("utf-8")), len(content)
+
+    data, index = _scan(content)
+    _write_index(fname, index)
+
+    return data, len(content)
+
+
+class ReadCache(object):
+    """Least recently used files, up to `budget` bytes
+
+    Thread-safe, as files are read from both the GUI and worker threads.
+
+    Arguments:
+        budget (int): Maximum number of bytes kept in memory
+
+    Example:
+        >>> cache = ReadCache(budget=100)
+        >>> cache.put(("a.rag", 0, 60), {"name": "a"}, 60)
+        >>> cache.put(("b.rag", 0, 60), {"name": "b"}, 60)
+        >>> cache.get(("a.rag", 0, 60)) is None
+        True
+        >>> cache.get(("b.rag", 0, 60))
+        {'name': 'b'}
+
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+
+        # Map key -> (data, size), least recently used first
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(fname):
+        """Return key of `fname` in its current state on disk"""
+        stat = os.stat(fname)
+        fname = os.path.normcase(os.path.abspath(fname))
+        return fname, stat.st_mtime, stat.st_size
+
+    def get(self, key):
+        """Return data of `key`, or None if not cached"""
+        with self._lock:
+            try:
+                data, size = self._entries.pop(key)
+            except KeyError:
+                return None
+
+            self._entries[key] = (data, size)
+
+        return data
+
+    def put(self, key, data, size):
+        """Add `data` of `size` bytes, evicting what no longer fits"""
+        if size > self.budget:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            # Previous versions of this file are never read again
+            for stale in [k for k in self._entries if k[0] == key[0]]:
+                self._size -= self._entries.pop(stale)[1]
+
+            self._entries[key] = (data, size)
+            self._size += size
+
+            while self._size > self.budget:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every cached read in this process
+cache = ReadCache(budget=constants.RAGDOLL_READ_CACHE * 1024 ** 2)
+
+
+def write(fname, data, opts=None):
+    """Write `data` to `fname`
+
+    Arguments:
+        fname (str): Absolute path to destination .rag file
+        data (dict): Dump, e.g. from `cmds.ragdollDump()`
+        opts (dict, optional): Options
+
+    Options:
+        format (int): Either constants.FormatAscii or FormatBinary
+        compression (int): One of constants.CompressionOff,
+            CompressionGzip or CompressionLzma
+        compact (bool): Write ASCII without indentation or whitespace
+        pool (bool): Store identical convex meshes once, see `pool_meshes`
+        quantize (bool): Store vertices of convex meshes as 16-bit
+            integers, see `quantize_meshes`. Implies `pool`.
+        quantizeError (float): Maximum error of quantized vertices
+        metadata (dict): Write this rather than a summary of `data`
+
+    """
+
+    opts = dict({
+        "format": constants.FormatAscii,
+        "compression": constants.CompressionOff,
+        "compact": False,
+        "pool": False,
+        "quantize": False,
+        "quantizeError": 0.001,
+        "metadata": None,
+    }, **(opts or {}))
+
+    metadata = opts["metadata"] or summarise(data)
+    data = dict(data, metadata=metadata)
+
+    if opts["pool"] or opts["quantize"]:
+        data = pool_meshes(data)
+
+    if opts["quantize"]:
+        data = quantize_meshes(data, opts["quantizeError"])
+
+    if opts["format"] == constants.FormatBinary:
+        content = encode(data)
+
+    else:
+        metadata = json.dumps(data.pop("metadata"), sort_keys=True)
+
+        if opts["compact"]:
+            content = json.dumps(materialise(data),
+                                 separators=(",", ":"),
+                                 sort_keys=True)
+
+        else:
+            content = json.dumps(materialise(data),
+                                 indent=4,
+                                 sort_keys=True)
+
+        # Metadata goes first, on a line of its own
+        content = _MetadataPrefix + (
+            "%s,\n%s" % (metadata, content[1:].lstrip("\n"))
+        ).encode("utf-8")
+
+    # Write next to the destination and then replace it, such that
+    # readers never see a partially written file
+    temp = "%s.%d.tmp" % (fname, os.getpid())
+
+    try:
+        with _open(temp, "wb", opts["compression"]) as f:
+            f.write(content)
+
+        _replace(temp, fname)
+
+    except Exception:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+        raise
+
+
+def _replace(src, dst):
+    """Rename `src` to `dst`, replacing `dst` if it exists"""
+    try:
+        os.replace(src, dst)
+
+    except AttributeError:
+        # Python 2, where rename won't replace files on Windows
+        if os.name == "nt" and os.path.exists(dst):
+            os.remove(dst)
+
+        os.rename(src, dst)
+
+
+def options(fname):
+    """Return write options matching the format and compression of `fname`
+
+    Example:
+        >>> options("character.rag")  # doctest: +SKIP
+        {'format': 1, 'compression': 2}
+
+    """
+
+    return {
+        "format": (constants.FormatBinary
+                   if is_binary(fname) else constants.FormatAscii),
+        "compression": _compression(fname),
+    }
+
+
+def summarise(data):
+    """Return metadata of dump `data`
+
+    Arguments:
+        data (dict): Dump, e.g. from `cmds.ragdollDump()`
+
+    Returns:
+        metadata (dict): Name, tags and thumbnail, where available,
+            along with info and the number of each type of component
+
+    """
+
+    ui = data.get("ui") or {}
+    metadata = {
+        key: ui[key]
+        for key in ("name", "tags", "thumbnail")
+        if key in ui
+    }
+
+    counts = {}
+    for value in data.get("entities", {}).values():
+        for name in value["components"]:
+            counts[name] = counts.get(name, 0) + 1
+
+    metadata["counts"] = counts
+    metadata["info"] = data.get("info") or {}
+
+    return metadata
+
+
+def read_metadata(fname, fallback=True):
+    """Return metadata of .rag file `fname`, without reading the rest
+
+    Arguments:
+        fname (str): Absolute path to .rag file
+        fallback (bool, optional): Read the full file if it was
+            written without metadata, otherwise return None
+
+    Example:
+        >>> metadata = read_metadata("character.rag")  # doctest: +SKIP
+        >>> metadata["counts"]["MarkerUIComponent"]  # doctest: +SKIP
+        24
+
+    """
+
+    metadata = None
+
+    with _open(fname) as f:
+        magic = f.read(len(BinaryMagic))
+
+        if magic == BinaryMagic:
+            preamble = magic + f.read(_Preamble.size - len(magic))
+            header_size = _Preamble.unpack(preamble)[3]
+            header = json.loads(f.read(header_size).decode("utf-8"))
+            metadata = header.get("metadata")
+
+        elif magic + f.read(len(_MetadataPrefix) - len(magic)) == (
+                _MetadataPrefix):
+            line = f.readline().decode("utf-8").rstrip()
+            metadata = json.loads(line.rstrip(","))
+
+    if metadata is None and fallback:
+        metadata = summarise(read(fname, cached=True))
+
+    return metadata
+
+
+def read_preview(fname):
+    """Return name, tags and thumbnail of `fname`, reading as little as possible
+
+    Safe to call from another process, e.g. to keep the GIL of
+    a user interface free. Failing to read `fname` is not an error,
+    an empty preview is returned instead.
+
+    Returns:
+        dict: With optional "name" and "tags", along with "thumbnail"
+            as the raw bytes of an image rather than base64
+
+    """
+
+    try:
+        preview = _read_preview(fname) or {}
+    except Exception as e:
+        log.debug("Could not preview %s: %s" % (fname, e))
+        preview = {}
+
+    preview = {
+        key: value for key, value in preview.items()
+        if key in ("name", "tags", "thumbnail")
+    }
+
+    if preview.get("thumbnail"):
+        preview["thumbnail"] = base64.b64decode(preview["thumbnail"])
+
+    return preview
+
+
+def _read_preview(fname):
+    # Files written with metadata carry everything we need up-front
+    metadata = read_metadata(fname, fallback=False)
+
+    if metadata is not None:
+        return metadata
+
+    if is_binary(fname):
+        # The "ui" field is part of the header, no need to be clever
+        return BinaryReader(fname).header().get("ui")
+
+    if is_compressed(fname):
+        # No reading backwards through a compressed stream
+        return read(fname, cached=True).get("ui")
+
+    try:
+        return _read_ui_backwards(fname)
+    except Exception as e:
+        log.debug(e)
+        return read(fname, cached=True).get("ui")
+
+
+def _read_ui_backwards(fname):
+    # File read and json.load doesn't release GIL until job done,
+    #   so if the file is big enough, everyone has to wait for it.
+    #
+    # To work around this, we take only what we need from the file,
+    #   which is the "ui" field. So we read the file backward and
+    #   find the keyword and ignore the rest.
+    #
+    # See link below for detail (it's a work journal)
+    # https://gitlab.ragdolldynamics.com/-/snippets/302
+    #
+    lines = []
+    for line in _reverse_readline(fname):
+        lines.append(line)
+        if b'"ui": {' in line:
+            lines.append(b"{")
+            break
+    lines.reverse()
+    return json.loads(b"\n".join(lines)).get("ui")
+
+
+def _reverse_readline(filename, buf_size=8192):
+    """A generator that returns the lines of a file in reverse order
+    https://stackoverflow.com/a/23646049/4145300
+    """
+    with open(filename, "rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        segment = None
+        offset = 0
+        file_size = remaining_size = fh.tell()
+
+        while remaining_size > 0:
+            offset = min(file_size, offset + buf_size)
+            fh.seek(file_size - offset)
+            buffer = fh.read(min(remaining_size, buf_size))
+            remaining_size -= buf_size
+            lines = buffer.split(b"\n")
+            # The first line of the buffer is probably not a complete line,
+            # so we'll save it and append it to the last line of the next
+            # buffer we read.
+            if segment is not None:
+                # If the previous chunk starts right from the beginning of
+                # line do not concat the segment to the last line of new
+                # chunk. Instead, yield the segment first
+                if buffer[-1] != b"\n":
+                    lines[-1] += segment
+                else:
+                    yield segment
+
+            segment = lines[0]
+            for index in range(len(lines) - 1, 0, -1):
+                if lines[index]:
+                    yield lines[index]
+
+        # Don't yield None if the file was empty
+        if segment is not None:
+            yield segment
+
+
+def materialise(data):
+    """Return `data` with any lazily read components read
+
+    The returned dump shares its components with `data`, and
+    is suitable for e.g. `json.dump`.
+
+    """
+
+    data = dict(data)
+    data["entities"] = {
+        entity: dict(value, components=dict(value["components"]))
+        for entity, value in data["entities"].items()
+    }
+
+    if "meshes" in data:
+        data["meshes"] = dict(data["meshes"])
+
+    return data
+
+
+def _mesh_key(members):
+    content = json.dumps([members["vertices"], members["indices"]],
+                         separators=(",", ":"),
+                         sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def pool_meshes(data):
+    """Return `data` with each unique convex mesh stored only once
+
+    Meshes are moved into a "meshes" table, and referenced by key from
+    each ConvexMeshComponents. Already pooled meshes are left as-is,
+    and entries no longer referenced are dropped.
+
+    Arguments:
+        data (dict): Dump, e.g. from `cmds.ragdollDump()`
+
+    """
+
+    pool = data.get("meshes") or {}
+    meshes = {}
+    entities = {}
+
+    for entity, value in data["entities"].items():
+        components = value["components"]
+
+        if "ConvexMeshComponents" not in components:
+            entities[entity] = value
+            continue
+
+        component = components["ConvexMeshComponents"]
+        members = dict(component["members"])
+
+        if "mesh" in members:
+            key = members["mesh"]["value"]
+            meshes[key] = pool[key]
+
+        else:
+            key = _mesh_key(members)
+            meshes[key] = {
+                "vertices": members.pop("vertices"),
+                "indices": members.pop("indices"),
+            }
+
+            members["mesh"] = {"type": "Mesh", "value": key}
+            component = dict(component, members=members)
+            components = dict(components, ConvexMeshComponents=component)
+
+        entities[entity] = dict(value, components=components)
+
+    data = dict(data, entities=entities)
+
+    if meshes:
+        data["meshes"] = meshes
+    else:
+        data.pop("meshes", None)
+
+    return data
+
+
+def quantize(points, error):
+    """Return PointArray `points` quantized to 16-bit integers
+
+    Arguments:
+        points (dict): Typed member, e.g. {"type": "PointArray", ...}
+        error (float): Maximum distance along any axis between
+            an original and quantized value
+
+    Returns:
+        points (dict): A QuantizedPointArray, or None if `points`
+            spans too large a distance for the given `error`
+
+    Example:
+        >>> points = {"type": "PointArray", "values": [0.0, 1, 2, 4, 5, 6]}
+        >>> quantized = quantize(points, error=0.01)
+        >>> quantized["bounds"], quantized["values"]
+        ([0.0, 1.0, 2.0, 4.0, 5.0, 6.0], [0, 0, 0, 65535, 65535, 65535])
+        >>> quantize(points, error=0.00001) is None
+        True
+
+    """
+
+    values = points["values"]
+
+    if not values:
+        return None
+
+    minimum = [float(min(values[axis::3])) for axis in range(3)]
+    maximum = [float(max(values[axis::3])) for axis in range(3)]
+    steps = [
+        (high - low) / QuantizedSteps
+        for low, high in zip(minimum, maximum)
+    ]
+
+    # Rounding is off by at most half a step
+    if max(steps) / 2 > error:
+        return None
+
+    quantized = [
+        int(round((value - minimum[index % 3]) / steps[index % 3]))
+        if steps[index % 3] else 0
+        for index, value in enumerate(values)
+    ]
+
+    return {
+        "type": "QuantizedPointArray",
+        "bounds": minimum + maximum,
+        "values": quantized,
+    }
+
+
+def quantize_meshes(data, error):
+    """Return `data` with vertices of pooled meshes quantized
+
+    Meshes are left at full precision when quantizing
+    would exceed `error`, or when already quantized.
+
+    Arguments:
+        data (dict): Dump, with meshes pooled by `pool_meshes`
+        error (float): Maximum error, in Maya's internal unit
+
+    """
+
+    meshes = {}
+
+    for key, members in (data.get("meshes") or {}).items():
+        if members["vertices"]["type"] == "PointArray":
+            vertices = quantize(members["vertices"], error)
+
+            if vertices is not None:
+                members = dict(members, vertices=vertices)
+
+        meshes[key] = members
+
+    if not meshes:
+        return data
+
+    return dict(data, meshes=meshes)
+
+
+def _column_kind(values):
+    """Determine how to store a column of member `values`"""
+    first = values[0]
+
+    if not isinstance(first, dict) or "type" not in first:
+        return "json"
+
+    kind = first["type"]
+    keys = {"type", "values"}
+
+    if kind in _FloatTypes:
+        number_types = (float,)
+    elif kind in _Typecodes:
+        number_types = _integer_types
+    else:
+        return "json"
+
+    if kind == "QuantizedPointArray":
+        # Bounds are stored alongside the column
+        keys.add("bounds")
+
+    width = len(first["values"])
+
+    for value in values:
+        if not isinstance(value, dict) or set(value) != keys:
+            return "json"
+
+        if value["type"] != kind:
+            return "json"
+
+        if kind not in _VariableTypes and len(value["values"]) != width:
+            return "json"
+
+        # Anything else wouldn't survive the round-trip,
+        # e.g. an integer in a matrix would come back as a float.
+        for number in value["values"]:
+            if type(number) not in number_types:
+                return "json"
+
+            if kind in _Limits and not 0 <= number < _Limits[kind]:
+                return "json"
+
+    return kind
+
+
+def _encode_block(name, components):
+    """Encode `components` of type `name` column by column
+
+    Arguments:
+        name (str): Name of component, e.g. "ConvexMeshComponents"
+        components (list): Pairs of entity and component
+
+    """
+
+    rows = [entity for entity, _ in components]
+    shells = [
+        {key: value for key, value in component.items() if key != "members"}
+        for _, component in components
+    ]
+
+    descriptor = {
+        "rows": rows,
+
+        # The component outside of its members, typically just its type
+        "shells": None if all(
+            shell == {"type": name} for shell in shells
+        ) else shells,
+
+        "columns": [],
+    }
+
+    # Gather members in order of first appearance
+    members = []
+    for _, component in components:
+        for member in component["members"]:
+            if member not in members:
+                members.append(member)
+
+    payload = []
+    offset = 0
+
+    for member in members:
+        indices = []
+        values = []
+
+        for index, (_, component) in enumerate(components):
+            if member in component["members"]:
+                indices.append(index)
+                values.append(component["members"][member])
+
+        column = {
+            "name": member,
+            "rows": None if len(indices) == len(rows) else indices,
+            "kind": _column_kind(values),
+        }
+
+        if column["kind"] == "json":
+            column["values"] = values
+
+        else:
+            typecode = _Typecodes.get(column["kind"], "d")
+            numbers = array.array(typecode)
+
+            for value in values:
+                numbers.extend(value["values"])
+
+            if column["kind"] in _VariableTypes:
+                column["lengths"] = [len(value["values"]) for value in values]
+            else:
+                column["width"] = len(values[0]["values"])
+
+            if column["kind"] == "QuantizedPointArray":
+                column["bounds"] = [value["bounds"] for value in values]
+
+            data = _to_bytes(numbers)
+            column["offset"] = offset
+            column["count"] = len(numbers)
+            payload.append(data)
+            offset += len(data)
+
+        descriptor["columns"].append(column)
+
+    descriptor = json.dumps(descriptor).encode("utf-8")
+
+    return b"".join(
+        [_BlockPreamble.pack(len(descriptor)), descriptor] + payload
+    )
+
+
+def _decode_block(name, block):
+    """Decode `block` into a dictionary of entity -> component"""
+    size, = _BlockPreamble.unpack_from(block)
+    start = _BlockPreamble.size + size
+    descriptor = json.loads(block[_BlockPreamble.size:start].decode("utf-8"))
+
+    rows = descriptor["rows"]
+    shells = descriptor["shells"] or [{"type": name}] * len(rows)
+    components = [dict(shell, members={}) for shell in shells]
+
+    for column in descriptor["columns"]:
+        indices = column["rows"]
+
+        if indices is None:
+            indices = range(len(rows))
+
+        kind = column["kind"]
+
+        if kind == "json":
+            values = column["values"]
+
+        else:
+            typecode = _Typecodes.get(kind, "d")
+            offset = start + column["offset"]
+            end = offset + column["count"] * array.array(typecode).itemsize
+            numbers = _from_bytes(typecode, block[offset:end])
+
+            if kind in _VariableTypes:
+                lengths = column["lengths"]
+            else:
+                lengths = [column["width"]] * len(indices)
+
+            values = []
+            offset = 0
+            for length in lengths:
+                values.append({
+                    "type": kind,
+                    "values": numbers[offset:offset + length].tolist()
+                })
+                offset += length
+
+            for value, bounds in zip(values, column.get("bounds", [])):
+                value["bounds"] = bounds
+
+        for index, value in zip(indices, values):
+            components[index]["members"][column["name"]] = value
+
+    return dict(zip(rows, components))
+
+
+def encode(data):
+    """Encode dump `data` into the binary format"""
+    header = {
+        key: value for key, value in data.items()
+        if key not in ("entities", "meshes")
+    }
+
+    contents = {
+        "entities": [],
+        "components": {},
+    }
+
+    # Group components by type, for columnar storage
+    by_type = {}
+
+    for entity, value in data["entities"].items():
+        # Stored as strings, like in JSON
+        entity = str(entity)
+
+        names = list(value["components"])
+        contents["entities"].append([
+            entity,
+            {key: value for key, value in value.items()
+             if key != "components"},
+            names
+        ])
+
+        for name in names:
+            component = value["components"][name]
+            by_type.setdefault(name, []).append((entity, component))
+
+    blocks = []
+    offset = 0
+
+    for name in sorted(by_type):
+        block = _encode_block(name, by_type[name])
+        contents["components"][name] = {
+            "offset": offset,
+            "size": len(block),
+        }
+
+        blocks.append(block)
+        offset += len(block)
+
+    if data.get("meshes"):
+        block = _encode_block("meshes", [
+            (key, {"members": members, "type": "meshes"})
+            for key, members in sorted(data["meshes"].items())
+        ])
+
+        contents["meshes"] = {
+            "keys": sorted(data["meshes"]),
+            "offset": offset,
+            "size": len(block),
+        }
+
+        blocks.append(block)
+
+    header = json.dumps(header).encode("utf-8")
+    contents = json.dumps(contents).encode("utf-8")
+    preamble = _Preamble.pack(BinaryMagic, 2, 0, len(header), len(contents))
+
+    return b"".join([preamble, header, contents] + blocks)
+
+
+def _skip(text, pos):
+    return _Whitespace.match(text, pos).end()
+
+
+def _scan(content):
+    """Parse JSON `content`, recording where each component is
+
+    Offsets are in bytes, such that components may later be read
+    from disk without reading what comes before or after them.
+
+    Returns:
+        data (dict): Parsed content
+        index (dict): Location of each header field and component
+
+    """
+
+    text = content.decode("utf-8")
+    decoder = json.JSONDecoder()
+
+    # Map character to byte offsets, these differ in the
+    # presence of multi-byte characters, such as in paths
+    is_ascii = len(text) == len(content)
+    cursor = [0, 0]
+
+    def byte(pos):
+        if is_ascii:
+            return pos
+
+        char, offset = cursor
+        offset += len(text[char:pos].encode("utf-8"))
+        cursor[:] = [pos, offset]
+        return offset
+
+    def members(pos):
+        """Iterate over key, position of value in object at `pos`"""
+        pos = _skip(text, pos)
+        assert text[pos] == "{", "Expected object at %d" % pos
+        pos = _skip(text, pos + 1)
+
+        while text[pos] != "}":
+            key, pos = decoder.raw_decode(text, pos)
+            pos = _skip(text, pos)
+            assert text[pos] == ":", "Expected ':' at %d" % pos
+            end = yield key, _skip(text, pos + 1)
+            pos = _skip(text, end)
+
+            if text[pos] == ",":
+                pos = _skip(text, pos + 1)
+
+        yield None, pos + 1
+
+    def value(pos):
+        value, end = decoder.raw_decode(text, pos)
+        return value, end
+
+    data = {}
+    index = {
+        "version": IndexVersion,
+        "header": {},
+        "entities": [],
+        "meshes": [],
+    }
+
+    it = members(0)
+    key, pos = next(it)
+
+    while key is not None:
+        if key == "meshes":
+            data["meshes"] = {}
+            meshes = members(pos)
+            mesh, pos = next(meshes)
+
+            while mesh is not None:
+                data["meshes"][mesh], end = value(pos)
+                index["meshes"].append([mesh, byte(pos), byte(end)])
+                mesh, pos = meshes.send(end)
+
+            key, pos = it.send(pos)
+            continue
+
+        if key != "entities":
+            data[key], end = value(pos)
+            index["header"][key] = [byte(pos), byte(end)]
+            key, pos = it.send(end)
+            continue
+
+        data["entities"] = {}
+        entities = members(pos)
+        entity, pos = next(entities)
+
+        while entity is not None:
+            shell = {}
+            components = {}
+            locations = []
+
+            fields = members(pos)
+            field, pos = next(fields)
+
+            while field is not None:
+                if field != "components":
+                    shell[field], end = value(pos)
+                    field, pos = fields.send(end)
+                    continue
+
+                names = members(pos)
+                name, pos = next(names)
+
+                while name is not None:
+                    components[name], end = value(pos)
+                    locations.append([name, byte(pos), byte(end)])
+                    name, pos = names.send(end)
+
+                field, pos = fields.send(pos)
+
+            data["entities"][entity] = dict(shell, components=components)
+            index["entities"].append([entity, shell, locations])
+            entity, pos = entities.send(pos)
+
+        key, pos = it.send(pos)
+
+    return data, index
+
+
+def _index_path(fname):
+    fname = os.path.normcase(os.path.abspath(fname))
+    key = hashlib.sha1(fname.encode("utf-8")).hexdigest()
+    return os.path.join(IndexDirectory, key + ".json")
+
+
+def _read_index(fname):
+    """Return index of `fname`, or None if missing or outdated
+
+    Index files start with a line holding the path of the file they
+    index, followed by the index itself.
+
+    """
+
+    path = _index_path(fname)
+
+    try:
+        with open(path) as f:
+            f.readline()
+            index = json.load(f)
+
+    except (IOError, OSError, ValueError):
+        return None
+
+    if not isinstance(index, dict):
+        return None
+
+    stat = os.stat(fname)
+
+    if index.get("version") != IndexVersion:
+        return None
+
+    if index.get("size") != stat.st_size:
+        return None
+
+    if index.get("mtime") != stat.st_mtime:
+        return None
+
+    try:
+        # Mark as recently used, see `_prune_indices`
+        os.utime(path, None)
+    except OSError:
+        pass
+
+    return index
+
+
+def _write_index(fname, index):
+    """Write `index` of `fname`, pruning old indices every so often
+
+    Pruning reads every index, so rather than on every write it
+    happens on the first write of this process and whenever another
+    eighth of `IndexBudget` has been written since.
+
+    """
+
+    global _unpruned
+
+    stat = os.stat(fname)
+    index = dict(index, size=stat.st_size, mtime=stat.st_mtime)
+    content = json.dumps(os.path.abspath(fname)) + "\n" + json.dumps(index)
+
+    try:
+        os.makedirs(IndexDirectory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            return log.debug("Could not create %s" % IndexDirectory)
+
+    # Readers in other threads and processes never see half an index
+    path = _index_path(fname)
+    temp = "%s.%d.%d.tmp" % (
+        path, os.getpid(), threading.current_thread().ident
+    )
+
+    try:
+        with open(temp, "w") as f:
+            f.write(content)
+
+        _replace(temp, path)
+
+    except (IOError, OSError):
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+        return log.debug("Could not write index for %s" % fname)
+
+    if _unpruned is None or _unpruned > IndexBudget // 8:
+        _unpruned = 0
+        _prune_indices(IndexBudget)
+
+    _unpruned += len(content)
+
+
+def _prune_indices(budget):
+    """Remove indices of files since removed, and those least recently used
+
+    Arguments:
+        budget (int): Maximum number of bytes of indices to keep
+
+    """
+
+    indices = []
+
+    try:
+        names = os.listdir(IndexDirectory)
+    except OSError:
+        return
+
+    for name in names:
+        if not name.endswith(".json"):
+            # E.g. an index still being written
+            continue
+
+        path = os.path.join(IndexDirectory, name)
+
+        try:
+            with open(path) as f:
+                fname = json.loads(f.readline())
+
+            stat = os.stat(path)
+
+            # Indices prior to version 3 had no path, and are never used
+            if not isinstance(fname, _string_types):
+                fname = None
+
+            if fname is None or not os.path.exists(fname):
+                os.remove(path)
+                continue
+
+        except (IOError, OSError, ValueError, TypeError):
+            # Another process got there first
+            continue
+
+        indices.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in indices)
+
+    for _, size, path in sorted(indices):
+        if total <= budget:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+        total -= size
+
+
+def _check_unchanged(fname, size, mtime):
+    """Raise IOError if `fname` has changed since it was first read"""
+    stat = os.stat(fname)
+
+    if (stat.st_size, stat.st_mtime) != (size, mtime):
+        raise IOError(
+            "%s has changed since it was read, read it again" % fname
+        )
+
+
+class IndexedReader(object):
+    """Read a plain JSON .rag file, one component type at a time
+
+    Arguments:
+        fname (str): Absolute path to .rag file
+        index (dict): Locations of its contents, from `_scan`
+
+    """
+
+    def __init__(self, fname, index):
+        self._fname = fname
+        self._index = index
+
+        # Decoded components, component name -> entity -> component
+        self._blocks = {}
+
+        # Component name -> entity -> byte range
+        self._locations = {}
+
+        for entity, _, locations in index["entities"]:
+            for name, start, end in locations:
+                self._locations.setdefault(name, {})[entity] = (start, end)
+
+        # Pooled meshes are read like a component type of their own
+        self._locations["meshes"] = {
+            key: (start, end) for key, start, end in index["meshes"]
+        }
+
+    def _read(self, f, start, end):
+        f.seek(start)
+        return json.loads(f.read(end - start).decode("utf-8"))
+
+    def _open(self):
+        _check_unchanged(self._fname, self._index["size"],
+                         self._index["mtime"])
+        return open(self._fname, "rb")
+
+    def header(self):
+        """Return everything but the entities"""
+        with self._open() as f:
+            return {
+                key: self._read(f, start, end)
+                for key, (start, end) in self._index["header"].items()
+            }
+
+    def dump(self):
+        """Return full dump, with components read on demand"""
+        data = self.header()
+        data["entities"] = {
+            entity: dict(shell, components=_Lazy(
+                functools.partial(self.component, entity),
+                [location[0] for location in locations]
+            ))
+            for entity, shell, locations in self._index["entities"]
+        }
+
+        if self._index["meshes"]:
+            data["meshes"] = _Lazy(self.mesh, [
+                location[0] for location in self._index["meshes"]
+            ])
+
+        return data
+
+    def _block(self, name):
+        if name not in self._blocks:
+            block = {}
+
+            with self._open() as f:
+                locations = sorted(self._locations[name].items(),
+                                   key=lambda item: item[1])
+
+                for key, (start, end) in locations:
+                    block[key] = self._read(f, start, end)
+
+            self._blocks[name] = block
+
+        return self._blocks[name]
+
+    def component(self, entity, name):
+        """Return component `name` of `entity`, reading it if necessary
+
+        Every component of the same type is read at once, as they
+        are typically accessed together, e.g. one per marker.
+
+        """
+
+        return self._block(name)[entity]
+
+    def mesh(self, key):
+        """Return pooled mesh `key`, reading every mesh if necessary"""
+        return self._block("meshes")[key]
+
+
+class BinaryReader(object):
+    """Read a binary .rag file, one component block at a time
+
+    Example:
+        >>> reader = BinaryReader("character.rag")  # doctest: +SKIP
+        >>> reader.header()["schema"]  # doctest: +SKIP
+        'ragdoll-1.0'
+
+    """
+
+    def __init__(self, fname):
+        self._fname = fname
+
+        # Decoded blocks, component name -> entity -> component
+        self._blocks = {}
+
+        # Blocks are read from wherever they were at this point
+        stat = os.stat(fname)
+        self._stat = (stat.st_size, stat.st_mtime)
+
+        # Compressed files are decompressed once, up-front, rather
+        # than decompressing everything up until each block on read.
+        self._buffer = None
+
+        if is_compressed(fname):
+            with _open(fname) as f:
+                self._buffer = f.read()
+
+        with self._open() as f:
+            preamble = f.read(_Preamble.size)
+            magic, major, _, header_size, contents_size = (
+                _Preamble.unpack(preamble)
+            )
+
+            assert magic == BinaryMagic, "%s was not a binary .rag file" % fname
+            assert major == 2, "%s is not supported (%d)" % (fname, major)
+
+            self._header = json.loads(f.read(header_size).decode("utf-8"))
+            self._contents = json.loads(
+                f.read(contents_size).decode("utf-8")
+            )
+
+        self._offset = _Preamble.size + header_size + contents_size
+
+    def _open(self):
+        if self._buffer is not None:
+            return io.BytesIO(self._buffer)
+
+        _check_unchanged(self._fname, *self._stat)
+        return open(self._fname, "rb")
+
+    def size(self):
+        """Return size of the uncompressed file, in bytes"""
+        if self._buffer is not None:
+            return len(self._buffer)
+
+        return os.path.getsize(self._fname)
+
+    def header(self):
+        """Return everything but the entities"""
+        return copy.deepcopy(self._header)
+
+    def dump(self):
+        """Return full dump, with components read on demand"""
+        data = self.header()
+        data["entities"] = {
+            entity: dict(shell, components=_Lazy(
+                functools.partial(self.component, entity), names
+            ))
+            for entity, shell, names in self._contents["entities"]
+        }
+
+        if "meshes" in self._contents:
+            data["meshes"] = _Lazy(self.mesh, self._contents["meshes"]["keys"])
+
+        return data
+
+    def _block(self, name, location):
+        if name not in self._blocks:
+            with self._open() as f:
+                f.seek(self._offset + location["offset"])
+                block = f.read(location["size"])
+
+            self._blocks[name] = _decode_block(name, block)
+
+        return self._blocks[name]
+
+    def _meshes(self):
+        return self._block("meshes", self._contents["meshes"])
+
+    def component(self, entity, name):
+        """Return component `name` of `entity`, reading it if necessary"""
+        location = self._contents["components"][name]
+        return self._block(name, location)[entity]
+
+    def mesh(self, key):
+        """Return pooled mesh `key`, reading every mesh if necessary"""
+        return self._meshes()[key]["members"]
+
+
+class _Lazy(Mapping):
+    """Mapping of values read on first access, e.g. components
+
+    Arguments:
+        read (callable): Return the value of a given key
+        keys (list): Every key, known up-front
+
+    """
+
+    def __init__(self, read, keys):
+        self._read = read
+        self._keys = list(keys)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+
+        return self._read(key)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __deepcopy__(self, memo):
+        return {
+            key: copy.deepcopy(self[key], memo)
+            for key in self._keys
+        }
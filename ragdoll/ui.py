@@ -4,8 +4,11 @@ import sys
 import time
 import json
 import ctypes
+import hashlib
 import logging
+import threading
 import datetime
+import collections
 import webbrowser
 import tempfile
 
@@ -19,6 +22,8 @@ from . import (
     options,
     licence,
     dump,
+    ragfile,
+    rag,
     constants as c,
     internal as i__,
     __,
@@ -2484,6 +2489,20 @@ class DumpWidget(QtWidgets.QWidget):
 
     def _reset(self):
         analysis = self._loader.analyse()
+        occupied_markers = set(analysis["occupied"])
+
+        # Map marker entity -> solver and group entity
+        marker_to_solver = {
+            marker: solver
+            for solver, markers in analysis["solverToMarkers"].items()
+            for marker in markers
+        }
+
+        marker_to_group = {
+            marker: group
+            for group, markers in analysis["groupToMarkers"].items()
+            for marker in markers
+        }
 
         def _transform(data, entity):
             shape_icon = None
@@ -2504,7 +2523,7 @@ class DumpWidget(QtWidgets.QWidget):
                 shape_icon = _resource("icons", shape_icon)
                 shape_icon = QtGui.QIcon(shape_icon)
 
-            occupied = entity in analysis["occupied"]
+            occupied = entity in occupied_markers
             no_transform = entity not in analysis["entityToTransform"]
             term = analysis["searchTerms"][entity]
 
@@ -2697,14 +2716,14 @@ class DumpWidget(QtWidgets.QWidget):
                 _marker_icon(data, entity)
                 _transform(data, entity)
 
-                Group = registry.get(entity, "GroupComponent")
-                parent_item = group_to_item.get(Group["entity"])
+                parent_item = group_to_item.get(marker_to_group.get(entity))
 
                 # A marker may or may not be part of a group,
                 # but is always part of a solver.
                 if not parent_item:
-                    Scene = registry.get(entity, "SceneComponent")
-                    parent_item = solver_to_item.get(Scene["entity"])
+                    parent_item = solver_to_item.get(
+                        marker_to_solver.get(entity)
+                    )
 
                 if not parent_item:
                     parent_item = root_item
@@ -2869,6 +2888,140 @@ class DumpWidget(QtWidgets.QWidget):
         view.setCurrentIndex(index)
 
 
+class ImportPreviewer(QtCore.QObject):
+    """Read .rag files for the import dialog, outside of the GUI thread
+
+    The most recently requested file is read first, followed by its
+    neighbours, such that stepping through a directory finds them
+    already read. Files requested in the meantime replace whatever
+    was still pending, and only the latest request is emitted.
+
+    Arguments:
+        capacity (int, optional): Number of previews kept in memory
+
+    """
+
+    # {"fname", "data", "thumbnail", "error"}
+    previewed = QtCore.Signal(object)
+
+    def __init__(self, capacity=5, parent=None):
+        super(ImportPreviewer, self).__init__(parent)
+
+        # fname -> preview, least recently used first
+        self._previews = collections.OrderedDict()
+        self._capacity = capacity
+
+        self._pending = []
+        self._current = None
+        self._wake = threading.Condition()
+        self._halt = None
+
+    def request(self, fname, neighbours=()):
+        """Emit a preview of `fname` once read, and read `neighbours` too"""
+        preview = self._cached(fname)
+        pending = [fname] if preview is None else []
+        pending += [n for n in neighbours if n != fname]
+
+        with self._wake:
+            self._current = fname
+            self._pending[:] = pending
+            self._wake.notify()
+
+        if self._halt is None:
+            self._halt = threading.Event()
+            thread = threading.Thread(target=self._run, args=[self._halt])
+            thread.daemon = True
+            thread.start()
+
+        if preview is not None:
+            self.previewed.emit(preview)
+
+    def stop(self):
+        if self._halt is None:
+            return
+
+        with self._wake:
+            self._halt.set()
+            self._pending[:] = []
+            self._wake.notify()
+
+        # Any file being read is left to finish on its own
+        self._halt = None
+
+    def _run(self, halt):
+        while True:
+            with self._wake:
+                while not (self._pending or halt.is_set()):
+                    self._wake.wait()
+
+                if halt.is_set():
+                    return
+
+                fname = self._pending.pop(0)
+
+            preview = self._cached(fname) or self._read(fname)
+
+            with self._wake:
+                if halt.is_set() or fname != self._current:
+                    continue
+
+            self.previewed.emit(preview)
+
+    def _cached(self, fname):
+        try:
+            key = ragfile.ReadCache.key(fname)
+        except OSError:
+            return None
+
+        with self._wake:
+            preview = self._previews.pop(fname, None)
+
+            if preview is None or preview["key"] != key:
+                return None
+
+            self._previews[fname] = preview
+
+        return preview
+
+    def _read(self, fname):
+        preview = {
+            "fname": fname,
+            "key": None,
+            "data": None,
+            "thumbnail": QtGui.QImage(),
+            "error": None,
+        }
+
+        try:
+            preview["key"] = ragfile.ReadCache.key(fname)
+            preview["data"] = rag.read(fname, cached=True)
+            thumbnail = (preview["data"].get("ui") or {}).get("thumbnail")
+
+            if thumbnail:
+                thumbnail = QtCore.QByteArray.fromBase64(
+                    thumbnail.encode("ascii")
+                )
+
+                # Fit it to our widget, once per thumbnail
+                thumbnail = posters.fetch(bytes(thumbnail), 200, 128)
+                preview["thumbnail"] = thumbnail
+
+        except Exception as e:
+            # The loader reports this once the file is loaded for real
+            log.debug("Could not preview %s: %s" % (fname, e))
+            preview["data"] = None
+            preview["error"] = str(e)
+            return preview
+
+        with self._wake:
+            self._previews[fname] = preview
+
+            while len(self._previews) > self._capacity:
+                self._previews.popitem(last=False)
+
+        return preview
+
+
 class ImportOptions(Options):
     before_reset = QtCore.Signal()
 
@@ -2947,13 +3100,18 @@ class ImportOptions(Options):
         widgets["DumpWidget"].selection_changed.connect(
             self.on_content_selection_changed)
 
+        previewer = ImportPreviewer(parent=self)
+        previewer.previewed.connect(self.on_previewed)
+
         self._loader = None
         self._selection_callback = None
         self._previous_dirname = None
+        self._fnames = []
+        self._previewer = previewer
         self._read_timer = QtCore.QTimer()
         self._read_timer.setInterval(200)
         self._read_timer.setSingleShot(True)
-        self._read_timer.timeout.connect(self.read)
+        self._read_timer.timeout.connect(self.on_read_timeout)
         self._default_thumbnail = default_thumbnail
 
         # Keep superclass informed
@@ -3044,16 +3202,56 @@ class ImportOptions(Options):
         self._loader.read(data)
         self.reset()
 
-    def read(self, fname=None):
+    def read(self, fname=None, data=None):
         fname = fname or self.parser.find("importPath").read()
         assert isinstance(fname, i__.string_types), "fname must be string"
 
         current_path = self.parser.find("importPath")
         current_path.write(fname, notify=False)
 
-        self._loader.read(fname)
+        self._loader.read(fname, data)
         self.reset()
 
+    def closeEvent(self, event):
+        self._previewer.stop()
+        return super(ImportOptions, self).closeEvent(event)
+
+    def on_read_timeout(self):
+        fname = self.parser.find("importPath").read()
+
+        if not fname:
+            return
+
+        # Have the next and previous file ready, for the arrow keys
+        dirname, basename = os.path.split(fname)
+        neighbours = []
+
+        if basename in self._fnames:
+            index = self._fnames.index(basename)
+            neighbours = [
+                os.path.join(dirname, self._fnames[i])
+                for i in (index + 1, index - 1)
+                if 0 <= i < len(self._fnames)
+            ]
+
+        self._previewer.request(fname, neighbours)
+
+    def on_previewed(self, preview):
+        # Selection has moved on since
+        if preview["fname"] != self.parser.find("importPath").read():
+            return
+
+        thumbnail = self._default_thumbnail
+
+        if not preview["thumbnail"].isNull():
+            thumbnail = QtGui.QPixmap.fromImage(preview["thumbnail"])
+
+        self._widgets["Thumbnail"].setPixmap(thumbnail)
+
+        # Files that could not be read are read again,
+        # for the loader to report why
+        self.read(preview["fname"], preview["data"])
+
     def on_path_changed(self, force=False):
         SUFFIX = ".rag"
 
@@ -3086,6 +3284,8 @@ class ImportOptions(Options):
 
             items = []
             fnames = i__.sort_filenames(fnames)
+            self._fnames = fnames
+
             for fname in fnames:
                 item = {
                     PathRole: fname,
@@ -3129,39 +3329,11 @@ class ImportOptions(Options):
             dirname, _ = os.path.split(original_path)
             path = os.path.join(dirname, filename)
 
-            # Make it official
+            # Make it official, the thumbnail follows once read
             current_path.write(path)
 
-        # Clear any current thumbnail
-        qthumbnail = self._default_thumbnail
-
-        # Fetch metadata, like description and thumbnail
-        try:
-            with open(path) as f:
-                data = json.load(f)
-
-        except Exception:
-            pass
-
         else:
-            ui = data.get("ui", {})
-            thumbnail = ui.get("thumbnail")
-
-            if thumbnail:
-                # From JSON's unicode
-                thumbnail = thumbnail.encode("ascii")
-
-                # To QPixmap
-                qthumbnail = base64_to_pixmap(thumbnail)
-
-                # Fit it to our widget
-                qthumbnail = qthumbnail.scaled(
-                    px(200), px(128),
-                    QtCore.Qt.KeepAspectRatio,
-                    QtCore.Qt.SmoothTransformation
-                )
-
-        self._widgets["Thumbnail"].setPixmap(qthumbnail)
+            self._widgets["Thumbnail"].setPixmap(self._default_thumbnail)
 
     def on_browsed(self):
         path, suffix = QtWidgets.QFileDialog.getOpenFileName(
@@ -3675,6 +3847,174 @@ def base64_to_pixmap(base64):
     return pixmap
 
 
+class PosterCache(object):
+    """Scaled thumbnails on disk, shared by every window showing them
+
+    Each poster is stored as a PNG named after a hash of the original
+    image along with the size and DPI scale it was scaled to, such that
+    it need only ever be decoded and scaled once. The least recently
+    used posters are removed once the total exceeds `budget` bytes.
+
+    Safe to use from any thread, posters are QImage rather than QPixmap.
+
+    Example:
+        >>> posters = PosterCache(tempfile.mkdtemp(), budget=1024 ** 2)
+        >>> with open(_resource("icons", "logo.png"), "rb") as f:
+        ...     data = f.read()
+        ...
+        >>> posters.fetch(data, 100, 100).isNull()
+        False
+        >>> digest = posters.digest(data)
+        >>> posters.fetch(None, 100, 100, digest=digest).isNull()
+        False
+        >>> posters.fetch(None, 50, 50, digest=digest).isNull()
+        True
+
+    """
+
+    def __init__(self, root, budget):
+        self._root = root
+        self._budget = budget
+        self._lock = threading.Lock()
+
+        # Bytes on disk, computed on first write
+        self._total = None
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha1(data).hexdigest()
+
+    def fname(self, digest, width, height,
+              aspect=QtCore.Qt.KeepAspectRatio):
+        return os.path.join(self._root, "%s-%dx%d@%g-%d.png" % (
+            digest, width, height, px(1.0), int(aspect)
+        ))
+
+    def fetch(self, data, width, height,
+              aspect=QtCore.Qt.KeepAspectRatio,
+              digest=None):
+        """Return `data` scaled to `width` and `height`, times DPI scale
+
+        Arguments:
+            data (bytes): Encoded image, e.g. PNG. If None, only
+                a previously cached poster of `digest` is returned
+            width (int): Unscaled width, e.g. 217
+            height (int): Unscaled height, e.g. 122
+            aspect (Qt.AspectRatioMode, optional): How to fit `data`
+            digest (str, optional): Hash of `data`, if already known
+
+        Returns:
+            QImage: Null if `data` could not be decoded, or if `data`
+                is None and there was no cached poster of `digest`
+
+        """
+
+        digest = digest or self.digest(data)
+        fname = self.fname(digest, width, height, aspect)
+
+        image = QtGui.QImage()
+
+        if os.path.exists(fname) and image.load(fname):
+            try:
+                # Mark as recently used
+                os.utime(fname, None)
+            except OSError:
+                pass
+
+            return image
+
+        if data is None or not image.loadFromData(data):
+            return QtGui.QImage()
+
+        image = image.scaled(
+            px(width), px(height),
+            aspect,
+            QtCore.Qt.SmoothTransformation
+        )
+
+        self._store(fname, image)
+
+        return image
+
+    def clear(self):
+        with self._lock:
+            for fname in self._posters():
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+
+            self._total = 0
+
+    def _store(self, fname, image):
+        try:
+            if not os.path.isdir(self._root):
+                os.makedirs(self._root)
+        except OSError:
+            # E.g. a read-only home directory, we'll scale it next time
+            return
+
+        # Never leave a half-written poster for another thread to find
+        f = QtCore.QSaveFile(fname)
+        if not (f.open(QtCore.QIODevice.WriteOnly) and
+                image.save(f, "png") and f.commit()):
+            log.debug("Could not cache poster: %s" % fname)
+            return
+
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._posters())
+            else:
+                self._total += os.path.getsize(fname)
+
+            if self._total > self._budget:
+                self._evict()
+
+    def _posters(self):
+        """Yield (mtime, size, fname) of every poster on disk"""
+        try:
+            names = os.listdir(self._root)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(".png"):
+                continue
+
+            fname = os.path.join(self._root, name)
+
+            try:
+                stat = os.stat(fname)
+            except OSError:
+                continue  # Evicted by another process
+
+            yield stat.st_mtime, stat.st_size, fname
+
+    def _evict(self):
+        posters = sorted(self._posters())
+        total = sum(size for _, size, _ in posters)
+
+        for _, size, fname in posters:
+            if total <= self._budget:
+                break
+
+            try:
+                os.remove(fname)
+            except OSError:
+                continue
+
+            total -= size
+
+        self._total = total
+
+
+# Scaled thumbnails of .rag files, see `PosterCache`
+posters = PosterCache(
+    os.path.expanduser("~/.ragdoll/posters"),
+    c.RAGDOLL_POSTER_CACHE * 1024 ** 2
+)
+
+
 def qtest_mouse_press(button, modifier, x, y):
     button = {
         "": QtCore.Qt.NoButton,
@@ -1,14 +1,17 @@
 
 import os
 import re
+import sys
 import time
 import json
 import logging
 import weakref
+import sqlite3
 import hashlib
 import traceback
 import threading
 import shiboken2
+import multiprocessing
 import subprocess
 import webbrowser
 from functools import partial
@@ -27,7 +30,12 @@ try:
 except ImportError:
     import urllib as request  # py2
 
-from .. import __, constants, options, ui
+try:
+    from concurrent import futures
+except ImportError:
+    futures = None  # py2
+
+from .. import __, constants, options, ragfile, ui
 
 RAGDOLL_DYNAMICS_VERSIONS_URL = "https://ragdolldynamics.com/version"
 RAGDOLL_DYNAMICS_RELEASES_URL = "https://learn.ragdolldynamics.com/news"
@@ -37,6 +45,13 @@ RAGDOLL_DEVELOPER = bool(os.getenv("RAGDOLL_DEVELOPER"))
 NO_INTERNET = bool(os.getenv("RAGDOLL_SKIP_UPDATE_CHECK"))
 NO_WORKER_THREAD_QT = bool(os.getenv("RAGDOLL_SINGLE_THREADED_QT"))
 NO_WORKER_THREAD_INTERNET = bool(os.getenv("RAGDOLL_SINGLE_THREADED_INTERNET"))
+NO_WORKER_PROCESS = bool(os.getenv("RAGDOLL_SINGLE_PROCESS"))
+
+# Metadata of previously seen assets, see `AssetIndex`
+ASSET_INDEX_PATH = os.path.expanduser("~/.ragdoll/assets.db")
+
+# Fewer files than this are read without the overhead of other processes
+PREVIEW_POOL_THRESHOLD = 5
 
 log = logging.getLogger("ragdoll")
 px = MQtUtil.dpiScale
@@ -1547,15 +1562,168 @@ def text_to_color(text):
     ).name()
 
 
+class AssetIndex(object):
+    """Persistent metadata of assets, keyed by path, mtime and size
+
+    Holds the name, tags, video and thumbnail hash of each asset, such
+    that unmodified files need not be read again on the next launch.
+    Scaled posters themselves live in `ui.posters`.
+    Any error, such as a read-only home directory, disables the index
+    rather than the library.
+
+    Connections can't be shared across threads, open and close the
+    index from the thread using it.
+
+    Example:
+        >>> index = AssetIndex(":memory:")
+        >>> index.open()
+        >>> index.put("a.rag", 1.0, 10, {"name": "A", "tags": {}})
+        >>> index.get("a.rag", 1.0, 10)["name"]
+        'A'
+        >>> index.get("a.rag", 2.0, 10) is None
+        True
+        >>> index.close()
+
+    """
+
+    # Bump whenever the table changes, to rebuild it
+    Version = 3
+
+    def __init__(self, fname=ASSET_INDEX_PATH):
+        self._fname = fname
+        self._db = None
+
+    def open(self):
+        try:
+            dirname = os.path.dirname(self._fname)
+
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+
+            db = sqlite3.connect(self._fname)
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+
+            if version != self.Version:
+                db.execute("DROP TABLE IF EXISTS assets")
+                db.execute(
+                    "CREATE TABLE assets ("
+                    "path TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+                    "name TEXT, tags TEXT, video TEXT, thumbnail TEXT)"
+                )
+                db.execute("PRAGMA user_version = %d" % self.Version)
+                db.commit()
+
+        except (sqlite3.Error, OSError) as e:
+            log.debug("Asset index unavailable: %s" % e)
+            return
+
+        self._db = db
+
+    def close(self):
+        if self._db is None:
+            return
+
+        try:
+            self._db.commit()
+            self._db.close()
+        except sqlite3.Error as e:
+            log.debug(e)
+
+        self._db = None
+
+    def get(self, path, mtime, size):
+        """Return metadata of `path`, unless modified since"""
+        if self._db is None:
+            return None
+
+        try:
+            row = self._db.execute(
+                "SELECT name, tags, video, thumbnail FROM assets "
+                "WHERE path = ? AND mtime = ? AND size = ?",
+                (path, mtime, size)
+            ).fetchone()
+
+        except sqlite3.Error as e:
+            log.debug(e)
+            return None
+
+        if row is None:
+            return None
+
+        name, tags, video, thumbnail = row
+        return {
+            "name": name,
+            "tags": json.loads(tags),
+            "video": video,
+            "thumbnail": thumbnail,
+        }
+
+    def put(self, path, mtime, size, data):
+        """Store `data` of `path`, with an optional `thumbnail` hash"""
+        if self._db is None:
+            return
+
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO assets "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, mtime, size,
+                 data.get("name"),
+                 json.dumps(data.get("tags") or {}),
+                 data.get("video"),
+                 data.get("thumbnail"))
+            )
+
+        except sqlite3.Error as e:
+            log.debug(e)
+
+    def prune(self, directories, paths):
+        """Forget files in `directories` other than `paths`"""
+        if self._db is None:
+            return
+
+        directories = set(os.path.normpath(d) for d in directories)
+        paths = set(paths)
+
+        try:
+            stale = [
+                (path,) for (path,) in self._db.execute(
+                    "SELECT path FROM assets"
+                )
+                if path not in paths and
+                os.path.normpath(os.path.dirname(path)) in directories
+            ]
+
+            self._db.executemany("DELETE FROM assets WHERE path = ?", stale)
+
+        except sqlite3.Error as e:
+            log.debug(e)
+
+
 class AssetLibrary(object):
 
     def __init__(self):
         self._status = dict()
-        self._stop = threading.Event()
         self._queue = queue.Queue()
         self._cache = []
         self._worker = None
 
+        # Files last sent to consumers, path -> (mtime, size)
+        self._known = dict()
+
+        # Directory listings, path -> (mtime, files)
+        self._listings = dict()
+
+        # Only one pass over the search paths at a time
+        self._lock = threading.RLock()
+
+        # Set to stop the current watcher, see `watch`
+        self._watching = threading.Event()
+        self._watcher = None
+
+        # Set to have the current pass give up, each pass has its own
+        self._halt = threading.Event()
+
     def get_user_path(self):
         return options.read("extraAssets")
 
@@ -1577,72 +1745,233 @@ class AssetLibrary(object):
     def reload(self):
         self.stop()
         self._cache = []
-        self._stop.clear()
         self._status.clear()
+        self._start(self._produce)
+
+    def refresh(self):
+        """Send jobs for only the files changed since last (re)load
+
+        Falls back to a full `reload` if nothing has been loaded yet.
+
+        """
+
+        # A pass in progress leaves jobs after "finish" of the last
+        if not any(job["type"] == "finish" for job in self._cache):
+            return self.reload()
+
+        # Have a pass in progress give up and exit on its own, rather
+        # than wait on it. This pass picks up where it left off. Jobs
+        # still queued are left for consumers to pick up.
+        self._halt.set()
+        self._start(self._sync, announce=True)
+
+    def _start(self, target, **kwargs):
+        """Run `target` in a worker thread, with a `halt` of its own"""
+        self._halt = threading.Event()
+        kwargs["halt"] = self._halt
 
         if NO_WORKER_THREAD_QT:
-            self._produce()
+            target(**kwargs)
         else:
-            self._worker = threading.Thread(target=self._produce)
+            self._worker = threading.Thread(target=target, kwargs=kwargs)
             self._worker.start()
 
+    def watch(self, interval=2.0):
+        """Look for changes to search paths every `interval` seconds
+
+        Created, modified and removed files are sent to consumers as
+        "create", "update" and "remove" jobs, as they happen.
+
+        """
+
+        if NO_WORKER_THREAD_QT or self._watcher is not None:
+            return
+
+        halt = threading.Event()
+
+        def poll():
+            while not halt.wait(interval):
+                if self._produced():
+                    self._sync(announce=False, halt=halt)
+
+        self._watching = halt
+        self._watcher = threading.Thread(target=poll)
+        self._watcher.daemon = True
+        self._watcher.start()
+
+    def unwatch(self):
+        if self._watcher is None:
+            return
+
+        self._watching.set()
+        self._watcher.join()
+        self._watcher = None
+
     def stop(self):
-        self._stop.set()
+        self._halt.set()
         if self._worker is not None:
             self._worker.join()
         self._queue.queue.clear()
 
     def terminate(self):
+        # Have any pass in progress give up before waiting on it
+        self._halt.set()
+        self._watching.set()
+
+        self.unwatch()
         self.stop()
         self._queue.put({"type": "terminate"})
 
     def rewind(self):
-        produced = self._cache and self._cache[-1]["type"] == "finish"
-        if produced and self._queue.empty():
-            for job in self._cache:
+        if self._produced() and self._queue.empty():
+            for job in list(self._cache):
                 self._queue.put(job)
 
+    def _produced(self):
+        return bool(self._cache) and self._cache[-1]["type"] == "finish"
+
     def _send_job(self, type_, payload):
         job = {"type": type_, "payload": payload}
         self._queue.put(job)
         self._cache.append(job)
 
-    def _produce(self):
+    def _compact(self):
+        """Keep only the latest job of each file, for `rewind`"""
+        created = dict()
+        updated = dict()
+
+        for job in self._cache:
+            if job["type"] == "create":
+                created[job["payload"]["path"]] = job
+            elif job["type"] == "update":
+                updated[job["payload"]["path"]] = job
+            elif job["type"] == "remove":
+                created.pop(job["payload"]["path"], None)
+                updated.pop(job["payload"]["path"], None)
+
+        self._cache[:] = (
+            [{"type": "start", "payload": None}] +
+            list(created.values()) +
+            list(updated.values()) +
+            [{"type": "finish", "payload": None}]
+        )
+
+    def _produce(self, halt=None):
+        with self._lock:
+            self._known.clear()
+            self._listings.clear()
+            self._send_job("start", None)
+            self._sync(announce=True, halt=halt)
+
+        # report
+        total = 0
+        valid = {k: v for k, v in self._status.items() if v}
+        for p, count in valid.items():
+            log.debug("%d assets were found from: %s" % (count, p))
+            total += count
+        log.debug("Total: %d asset from %d valid dir." % (total, len(valid)))
+
+    def _sync(self, announce, halt=None):
+        """Send jobs for files changed since the last sync
+
+        Arguments:
+            announce (bool): Send "finish" even if nothing changed
+            halt (threading.Event, optional): Give up once set
+
+        """
+
+        def halted():
+            return halt is not None and halt.is_set()
+
+        with self._lock:
+            if halted():
+                return
+
+            index = AssetIndex()
+            index.open()
+
+            try:
+                self._sync_indexed(index, announce, halted)
+            finally:
+                index.close()
+
+    def _sync_indexed(self, index, announce, halted):
         rag_files = list()
-        self._send_job("start", None)
+        lib_paths = list()
+        current = dict()
 
         for lib_path in self.search_paths():
+            lib_paths.append(lib_path)
             for rag_path in self._iter_rag_files(lib_path):
-                if self._stop.is_set():
+                if halted():
                     return
-                _stat = os.stat(rag_path)
+                try:
+                    _stat = os.stat(rag_path)
+                except OSError:
+                    continue  # removed since listed
                 mtime = _stat.st_mtime
-                data = {"path": rag_path, "_mtime": mtime}
-                self._send_job("create", data)
+                current[rag_path] = (mtime, _stat.st_size)
+
+                if current[rag_path] == self._known.get(rag_path):
+                    continue
+
+                if rag_path not in self._known:
+                    data = {"path": rag_path, "_mtime": mtime}
+                    self._send_job("create", data)
+
+                    # Created, but not yet up to date
+                    self._known[rag_path] = (None, None)
+
                 # group by size (5MB) and then sort by mtime
                 fsize = int(_stat.st_size / 1048576 / 5)
                 rag_files.append((-fsize, mtime, rag_path))
 
+        removed = [path for path in self._known if path not in current]
+
+        for rag_path in removed:
+            self._send_job("remove", {"path": rag_path})
+            self._known.pop(rag_path)
+
         # sort processing order by file size and modified time
         rag_files.sort(reverse=True)
 
+        unindexed = list()
+
         for _, mtime, rag_path in rag_files:
-            if self._stop.is_set():
+            if halted():
                 return
-            log.debug("Loading: %s" % rag_path)
-            data = self._load_rag_file(rag_path) or {}
-            data = self._refine_rag_data(rag_path, data)
+
+            indexed = index.get(rag_path, mtime, current[rag_path][1])
+            data = indexed and self._restore_rag_data(rag_path, indexed)
+
+            if data is None:
+                unindexed.append(rag_path)
+                continue
+
             self._send_job("update", data)
+            self._known[rag_path] = current[rag_path]
 
-        self._send_job("finish", None)
+        for rag_path, preview in self._read_previews(unindexed, halted):
+            if halted():
+                return
 
-        # report
-        total = 0
-        valid = {k: v for k, v in self._status.items() if v}
-        for p, count in valid.items():
-            log.debug("%d assets were found from: %s" % (count, p))
-            total += count
-        log.debug("Total: %d asset from %d valid dir." % (total, len(valid)))
+            data = self._refine_rag_data(rag_path, preview)
+            mtime, size = current[rag_path]
+            index.put(rag_path, mtime, size, {
+                "name": data["name"],
+                "tags": data["tags"],
+                "video": data["video"],
+                "thumbnail": data["digest"],
+            })
+
+            self._send_job("update", data)
+            self._known[rag_path] = current[rag_path]
+
+        index.prune(lib_paths, current)
+
+        if announce or rag_files or removed:
+            self._send_job("finish", None)
+            self._compact()
 
     def _iter_rag_files(self, lib_path):
         status = self._status
@@ -1651,51 +1980,100 @@ class AssetLibrary(object):
             status[lib_path] = None
             return
 
+        # Listing only changes along with the mtime of its directory
+        mtime = os.stat(lib_path).st_mtime
+        listing = self._listings.get(lib_path)
+
+        if listing is None or listing[0] != mtime:
+            listing = (mtime, [
+                item for item in os.listdir(lib_path)
+                if item.endswith(".rag")
+            ])
+
+            self._listings[lib_path] = listing
+
         status[lib_path] = 0
-        for item in os.listdir(lib_path):
+        for item in listing[1]:
             path = os.path.join(lib_path, item)
 
-            if item.endswith(".rag") and os.path.isfile(path):
+            if os.path.isfile(path):
                 status[lib_path] += 1
                 yield path
 
-    def _load_rag_file(self, file_path):
+    def _read_previews(self, file_paths, halted=None):
+        """Yield the path and `ragfile.read_preview` of each file
+
+        Files are read in other processes where possible, as reading
+        and parsing holds the GIL and would otherwise stall Maya.
+        Files still being read once `halted` are left to finish in
+        the background rather than waited upon.
+
+        """
+
+        pool = None
+
+        if len(file_paths) >= PREVIEW_POOL_THRESHOLD:
+            pool = _preview_pool()
+
+        if pool is None:
+            for file_path in file_paths:
+                log.debug("Loading: %s" % file_path)
+                yield file_path, ragfile.read_preview(file_path)
+
+            return
+
+        jobs = {
+            pool.submit(ragfile.read_preview, file_path): file_path
+            for file_path in file_paths
+        }
+
         try:
-            return self._load_rag_file_fast(file_path)
-        except Exception as e:
-            log.debug(e)
-            with open(file_path) as _f:
+            for job in futures.as_completed(jobs):
+                file_path = jobs[job]
+
                 try:
-                    rag = json.load(_f)
-                except ValueError as e:
+                    preview = job.result()
+                except Exception as e:
+                    # E.g. a worker that died, try again in-process
                     log.debug(e)
-                    return None
-            return rag.get("ui") or {}
-
-    def _load_rag_file_fast(self, file_path):
-        # File read and json.load doesn't release GIL until job done,
-        #   so if the file is big enough, everyone has to wait for it.
-        #
-        # To work around this, we take only what we need from the file,
-        #   which is the "ui" field. So we read the file backward and
-        #   find the keyword and ignore the rest.
-        #
-        # See link below for detail (it's a work journal)
-        # https://gitlab.ragdolldynamics.com/-/snippets/302
-        #
-        lines = []
-        for line in reverse_readline(file_path):
-            lines.append(line)
-            if b'"ui": {' in line:
-                lines.append(b"{")
-                break
-        lines.reverse()
-        try:
-            rag = json.loads(b"\n".join(lines))
-        except ValueError as e:
-            log.debug(e)
-            return None
-        return rag.get("ui") or {}
+                    preview = ragfile.read_preview(file_path)
+
+                yield file_path, preview
+
+        finally:
+            for job in jobs:
+                job.cancel()
+
+            pool.shutdown(wait=not (halted and halted()))
+
+    def _restore_rag_data(self, file_path, indexed):
+        """Return data like `_refine_rag_data`, from `AssetIndex`
+
+        Returns None if the poster has since been evicted from
+        `ui.posters`, and the file must be read once more.
+
+        """
+
+        poster = QtGui.QImage()
+
+        if indexed["thumbnail"]:
+            poster = ui.posters.fetch(
+                None, 217, 122,
+                QtCore.Qt.KeepAspectRatioByExpanding,
+                digest=indexed["thumbnail"]
+            )
+
+            if poster.isNull():
+                return None
+
+        return {
+            "name": indexed["name"],
+            "video": indexed["video"],
+            "tags": indexed["tags"],
+            "path": file_path,
+            "thumbnail": poster,
+            "digest": indexed["thumbnail"],
+        }
 
     def _refine_rag_data(self, file_path, data):
         lib_path, fname = os.path.split(file_path)
@@ -1703,17 +2081,22 @@ class AssetLibrary(object):
         _d = {
             "name": fname,
             "video": fname + ".webm",
-            "thumbnail": "",
+            "thumbnail": b"",
             "tags": {},
         }
         _d.update(data)
 
-        poster = ui.base64_to_pixmap(_d["thumbnail"].encode("ascii"))
-        if not poster.isNull():
-            poster = poster.scaled(
-                px(217), px(122),
+        # An image rather than pixmap, as this runs outside the GUI thread,
+        # pixmaps are made from these once displayed
+        poster = QtGui.QImage()
+        digest = None
+
+        if _d["thumbnail"]:
+            digest = ui.posters.digest(_d["thumbnail"])
+            poster = ui.posters.fetch(
+                _d["thumbnail"], 217, 122,
                 QtCore.Qt.KeepAspectRatioByExpanding,
-                QtCore.Qt.SmoothTransformation
+                digest=digest
             )
 
         if isinstance(_d["tags"], dict):
@@ -1732,45 +2115,45 @@ class AssetLibrary(object):
         _d.update({
             "path": file_path,
             "thumbnail": poster,
+            "digest": digest if not poster.isNull() else None,
             "tags": tags,
         })
 
         return _d
 
 
-def reverse_readline(filename, buf_size=8192):
-    """A generator that returns the lines of a file in reverse order
-    https://stackoverflow.com/a/23646049/4145300
+def _preview_pool():
+    """Return a pool of processes for reading previews, or None
+
+    Maya's own executable won't run Python scripts, so workers run
+    with the neighbouring mayapy.
+
     """
-    with open(filename, "rb") as fh:
-        fh.seek(0, os.SEEK_END)
-        segment = None
-        offset = 0
-        file_size = remaining_size = fh.tell()
-
-        while remaining_size > 0:
-            offset = min(file_size, offset + buf_size)
-            fh.seek(file_size - offset)
-            buffer = fh.read(min(remaining_size, buf_size))
-            remaining_size -= buf_size
-            lines = buffer.split(b"\n")
-            # The first line of the buffer is probably not a complete line,
-            # so we'll save it and append it to the last line of the next
-            # buffer we read.
-            if segment is not None:
-                # If the previous chunk starts right from the beginning of
-                # line do not concat the segment to the last line of new
-                # chunk. Instead, yield the segment first
-                if buffer[-1] != b"\n":
-                    lines[-1] += segment
-                else:
-                    yield segment
 
-            segment = lines[0]
-            for index in range(len(lines) - 1, 0, -1):
-                if lines[index]:
-                    yield lines[index]
+    if futures is None or NO_WORKER_THREAD_QT or NO_WORKER_PROCESS:
+        return None
+
+    dirname, basename = os.path.split(sys.executable)
+    candidates = [
+        os.path.join(dirname, "mayapy"),
+        os.path.join(dirname, "mayapy.exe"),
+        os.path.join(dirname, os.pardir, "bin", "mayapy"),  # macOS
+    ]
+
+    if "python" in basename.lower() or "mayapy" in basename.lower():
+        candidates.insert(0, sys.executable)
+
+    for executable in candidates:
+        if os.path.isfile(executable):
+            break
+    else:
+        log.debug("No Python executable found for previews")
+        return None
+
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(os.path.normpath(executable))
 
-        # Don't yield None if the file was empty
-        if segment is not None:
-            yield segment
+    return futures.ProcessPoolExecutor(
+        max_workers=min(4, multiprocessing.cpu_count()),
+        mp_context=context,
+    )
@@ -401,8 +401,12 @@ class AssetVideoPoster(QtWidgets.QWidget):
     def set_poster(self, poster):
         """
         Args:
-            poster (QtGui.QPixmap):
+            poster (QtGui.QPixmap or QtGui.QImage):
         """
+        if isinstance(poster, QtGui.QImage):
+            # Images are read off the GUI thread, pixmaps are made here
+            poster = QtGui.QPixmap.fromImage(poster)
+
         self._image = poster
 
     def paintEvent(self, event):
@@ -746,6 +750,9 @@ class AssetCardModel(base.BaseItemModel):
         self.card_created.emit(item.index())
 
     def update_item(self, data):
+        if data["path"] not in self._row_map:
+            return
+
         row = self._row_map[data["path"]]
         index = self.index(row, 0)
 
@@ -756,6 +763,17 @@ class AssetCardModel(base.BaseItemModel):
 
         self.card_updated.emit(index)
 
+    def remove_item(self, data):
+        row = self._row_map.pop(data["path"], None)
+        if row is None:
+            return
+
+        self.removeRow(row)
+
+        for path, other in self._row_map.items():
+            if other > row:
+                self._row_map[path] = other - 1
+
     def _do(self, job):
         if job["type"] == "start":
             self.clear()
@@ -763,6 +781,8 @@ class AssetCardModel(base.BaseItemModel):
             self.create_item(job["payload"])
         elif job["type"] == "update":
             self.update_item(job["payload"])
+        elif job["type"] == "remove":
+            self.remove_item(job["payload"])
         elif job["type"] == "finish":
             self.load_finished.emit(self.rowCount())
 
@@ -784,8 +804,7 @@ class AssetCardModel(base.BaseItemModel):
     def reload(self):
         if self._worker is None:
             return
-        asset_library.stop()
-        asset_library.reload()
+        asset_library.refresh()
         self.start()
 
 
@@ -913,6 +932,26 @@ class AssetTagList(QtWidgets.QWidget):
             item.widget().deleteLater()
             item = layout.takeAt(0)
 
+    def retain(self, tag_names):
+        """Remove tags other than `tag_names`, e.g. of removed assets"""
+        layout = self.layout()
+        untagged = False
+
+        for index in reversed(range(layout.count())):
+            button = layout.itemAt(index).widget()
+
+            if button.text() in tag_names:
+                continue
+
+            untagged = untagged or button.isChecked()
+            self._tags.pop(button.text(), None)
+            layout.takeAt(index)
+            button.setParent(None)
+            button.deleteLater()
+
+        if untagged:
+            self.on_tag_toggled(None)
+
     def on_tag_toggled(self, _):
         activated = set()
         for btn in self.children():
@@ -1021,11 +1060,23 @@ class AssetListPage(QtWidgets.QWidget):
         self._models["Source"].update_tags(index, colored_tags)
         proxy_index = self._models["Proxy"].mapFromSource(index)
         widget = self._widgets["List"].indexWidget(proxy_index)
-        widget.update_item(index)
+
+        # Filtered out by tags, updated once shown
+        if widget is not None:
+            widget.update_item(index)
 
     def on_load_finished(self, count):
         asset_loaded = bool(count)
 
+        # Forget tags of assets removed since
+        model = self._models["Source"]
+        self._widgets["Tags"].retain(set(
+            name
+            for row in range(model.rowCount())
+            for name in model.index(row, 0).data(AssetCardModel.TagsRole)
+            or {}
+        ))
+
         status = "No assets found, try adding a path in Extra Assets below"
         self._widgets["Status"].setText(status)
         self._widgets["Status"].setVisible(not asset_loaded)
@@ -1075,13 +1126,13 @@ class AssetListPage(QtWidgets.QWidget):
         self._widgets["Path"].setEnabled(False)
         self._widgets["Browse"].setEnabled(False)
         self._widgets["Reload"].setEnabled(False)
-        self._widgets["Tags"].clear()
         self._models["Source"].reload()
 
     def start_worker(self):
         self._models["Source"].start()
         if not base.NO_WORKER_THREAD_QT:
             asset_library.rewind()
+            asset_library.watch()
 
     def terminate_worker(self):
         self._models["Source"].terminate()
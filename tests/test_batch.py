@@ -0,0 +1,166 @@
+import shutil
+import unittest
+
+from ragdoll import batch, rag, ragfile, constants
+
+from .util import TempDirTestCase, asset, normalise
+
+NewMembers = (
+    "useLinearAngularStiffness",
+    "angularStiffness",
+    "angularDampingRatio",
+    "linearStiffness",
+    "linearDampingRatio",
+)
+
+
+def _downgrade(fname):
+    """Write `fname` as it was prior to linear and angular stiffness"""
+    data = normalise(ragfile.read(fname, indexed=False))
+
+    for value in data["entities"].values():
+        for name in ("GroupUIComponent", "MarkerUIComponent"):
+            if name in value["components"]:
+                members = value["components"][name]["members"]
+
+                for member in NewMembers:
+                    members.pop(member, None)
+
+    ragfile.write(fname, data, ragfile.options(fname))
+
+
+class TestProcess(TempDirTestCase):
+
+    def setUp(self):
+        super(TestProcess, self).setUp()
+        self.base = self.path("base.rag")
+        shutil.copy(asset("dog.rag"), self.base)
+        _downgrade(self.base)
+
+    def test_upgrade(self):
+        result = batch.process(
+            self.base, [batch.upgrade_linear_angular_stiffness]
+        )
+
+        self.assertIsNone(result["error"])
+        self.assertTrue(result["written"])
+
+        # Already upgraded
+        result = batch.process(
+            self.base, [batch.upgrade_linear_angular_stiffness]
+        )
+
+        self.assertFalse(result["changed"])
+        self.assertFalse(result["written"])
+
+    def test_metadata_kept(self):
+        data = ragfile.read(self.base, indexed=False)
+        metadata = dict(ragfile.summarise(data), name="Good boy")
+        ragfile.write(self.base, data, {"metadata": metadata})
+
+        before = ragfile.read_metadata(self.base, fallback=False)
+        self.assertEqual(before["name"], "Good boy")
+
+        result = batch.process(
+            self.base, [batch.upgrade_linear_angular_stiffness]
+        )
+
+        self.assertTrue(result["written"])
+        self.assertEqual(
+            ragfile.read_metadata(self.base, fallback=False), before
+        )
+
+    def test_meshes_not_pooled(self):
+        # Still readable by the versions of Ragdoll it was written for
+        batch.process(self.base, [batch.upgrade_linear_angular_stiffness])
+        self.assertNotIn("meshes", ragfile.read(self.base, indexed=False))
+
+    def test_convert(self):
+        result = batch.process(self.base, opts={
+            "format": constants.FormatBinary
+        })
+
+        self.assertEqual(result["changed"], [])
+        self.assertTrue(result["written"])
+        self.assertEqual(ragfile.options(self.base)["format"],
+                         constants.FormatBinary)
+
+    def test_dry_run(self):
+        with open(self.base, "rb") as f:
+            before = f.read()
+
+        result = batch.process(
+            self.base,
+            [batch.upgrade_linear_angular_stiffness],
+            {"dryRun": True}
+        )
+
+        self.assertTrue(result["changed"])
+        self.assertFalse(result["written"])
+
+        with open(self.base, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+    def test_error(self):
+        fname = self.path("broken.rag")
+
+        with open(fname, "w") as f:
+            f.write("{")
+
+        result = batch.process(fname)
+        self.assertTrue(result["error"])
+
+
+class TestRun(TempDirTestCase):
+
+    def test_serial_and_parallel(self):
+        fnames = []
+
+        for index in range(3):
+            fname = self.path("dog%d.rag" % index)
+            shutil.copy(asset("dog.rag"), fname)
+            fnames.append(fname)
+
+        for workers in (1, 2):
+            results = list(batch.run(fnames, workers=workers,
+                                     opts={"dryRun": True}))
+
+            self.assertEqual(sorted(r["fname"] for r in results), fnames)
+            self.assertTrue(all(r["error"] is None for r in results))
+
+
+class TestPatch(TempDirTestCase):
+    """Patches only hold differences, and are left alone"""
+
+    def setUp(self):
+        super(TestPatch, self).setUp()
+        self.base = self.path("base.rag")
+        shutil.copy(asset("dog.rag"), self.base)
+
+    def test_left_alone(self):
+        data = normalise(ragfile.read(self.base, indexed=False))
+        data["ui"] = dict(data.get("ui") or {}, name="Changed")
+
+        fname = self.path("patch.rag")
+        rag.write_patch(fname, self.base, data)
+
+        with open(fname, "rb") as f:
+            before = f.read()
+
+        result = batch.process(
+            fname,
+            [batch.upgrade_linear_angular_stiffness],
+            {"validate": True}
+        )
+
+        self.assertIsNone(result["error"])
+        self.assertTrue(result["patch"])
+        self.assertFalse(result["written"])
+        self.assertEqual(result["reasons"], rag.validate(rag.read(fname)))
+
+        with open(fname, "rb") as f:
+            self.assertEqual(f.read(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
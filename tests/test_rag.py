@@ -0,0 +1,280 @@
+import io
+import os
+import sys
+import copy
+import time
+import shutil
+import logging
+import unittest
+
+from ragdoll import rag, ragfile, constants
+
+from .util import TempDirTestCase, asset, normalise
+
+
+class TestPointArray(unittest.TestCase):
+    """Points decode alike with and without NumPy"""
+
+    values = [0.5, 1.0, -2.0, 3.0, 4.5, 6.0]
+
+    def assert_decoded(self):
+        points = rag.PointArray(self.values)
+
+        self.assertEqual(len(points), 2)
+        self.assertEqual(points[1], (3.0, 4.5, 6.0))
+        self.assertEqual(points[-1], points[1])
+        self.assertEqual(list(points), points.tolist())
+        self.assertEqual((points / (0.5, 2, -2)).tolist(),
+                         [(1.0, 0.5, 1.0), (6.0, 2.25, -3.0)])
+
+        with self.assertRaises(IndexError):
+            points[2]
+
+    @unittest.skipIf(rag.numpy is None, "NumPy not available")
+    def test_numpy(self):
+        self.assert_decoded()
+
+    def test_array(self):
+        numpy, rag.numpy = rag.numpy, None
+
+        try:
+            self.assert_decoded()
+        finally:
+            rag.numpy = numpy
+
+    def test_registry(self):
+        data = ragfile.read(asset("manikin.rag"), indexed=False)
+        registry = rag.Registry(data)
+
+        for entity in registry.view("ConvexMeshComponents"):
+            members = data["entities"][str(entity)]["components"]
+            members = members["ConvexMeshComponents"]["members"]
+            meshes = registry.get(entity, "ConvexMeshComponents")
+
+            self.assertIsInstance(meshes["vertices"], rag.PointArray)
+            self.assertEqual(
+                [value for point in meshes["vertices"] for value in point],
+                members["vertices"]["values"]
+            )
+            self.assertEqual(list(meshes["indices"]),
+                             members["indices"]["values"])
+
+
+def _edit(data):
+    """Return a copy of `data` with a little of everything changed"""
+    data = copy.deepcopy(data)
+    entities = sorted(data["entities"], key=int)
+
+    # Changed component
+    name = data["entities"][entities[0]]["components"]["NameComponent"]
+    name["members"]["value"] = "changed"
+
+    # Removed component
+    components = data["entities"][entities[1]]["components"]
+    components.pop(sorted(components)[0])
+
+    # Removed and added entity
+    data["entities"]["999999"] = data["entities"].pop(entities[2])
+
+    # Changed header
+    data["ui"] = dict(data.get("ui") or {}, name="Changed")
+
+    return data
+
+
+class TestPatch(TempDirTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.base = normalise(ragfile.pool_meshes(
+            ragfile.read(asset("manikin.rag"), indexed=False)
+        ))
+        cls.data = _edit(cls.base)
+
+    def test_make_and_apply(self):
+        patch = rag.make_patch(self.base, self.data)
+        self.assertEqual(normalise(rag.apply_patch(self.base, patch)),
+                         self.data)
+
+    def test_base_left_alone(self):
+        base = copy.deepcopy(self.base)
+        rag.apply_patch(base, rag.make_patch(base, self.data))
+        self.assertEqual(base, self.base)
+
+    def test_only_changes(self):
+        patch = rag.make_patch(self.base, self.data)
+        self.assertEqual(len(patch["entities"]), 2)
+        self.assertEqual(patch["added"]["entities"], [999999])
+        self.assertEqual(patch["removed"]["entities"], [
+            min(int(entity) for entity in self.base["entities"]
+                if entity not in self.data["entities"])
+        ])
+        self.assertEqual(len(patch["removed"]["components"]), 1)
+
+        # Changed entities hold only what changed
+        changed = min(self.base["entities"], key=int)
+        self.assertEqual(list(patch["entities"][changed]["components"]),
+                         ["NameComponent"])
+
+    def test_changed_base(self):
+        patch = rag.make_patch(self.base, self.data)
+
+        # Base re-exported without the entities the patch refers to
+        base = copy.deepcopy(self.base)
+        for entity in patch["removed"]["components"]:
+            base["entities"].pop(entity)
+
+        logging.disable(logging.WARNING)
+
+        try:
+            data = rag.apply_patch(base, patch)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self.assertEqual(data["ui"]["name"], "Changed")
+
+    def test_changed_entity_missing_from_base(self):
+        patch = rag.make_patch(self.base, self.data)
+        changed = min(self.base["entities"], key=int)
+
+        base = copy.deepcopy(self.base)
+        base["entities"].pop(changed)
+
+        with self.assertLogs("ragdoll", logging.WARNING):
+            data = rag.apply_patch(base, patch)
+
+        # Rather than an entity with nothing but a NameComponent
+        self.assertNotIn(changed, data["entities"])
+        self.assertIn("999999", data["entities"])
+
+    def test_read_and_write(self):
+        base_fname = self.path("base.rag")
+        fname = self.path("patch.rag")
+
+        for fmt in (constants.FormatAscii, constants.FormatBinary):
+            ragfile.write(base_fname, self.base, {"format": fmt})
+            rag.write_patch(fname, base_fname, self.data, {"format": fmt})
+
+            self.assertEqual(ragfile.read(fname)["schema"], rag.PatchSchema)
+            self.assertEqual(normalise(rag.read(fname)), self.data)
+            self.assertEqual(normalise(rag.read(fname, cached=True)),
+                             self.data)
+
+            # Previews like any other file
+            metadata = ragfile.read_metadata(fname, fallback=False)
+            self.assertEqual(metadata["name"], "Changed")
+            self.assertEqual(
+                metadata["counts"],
+                ragfile.summarise(self.data)["counts"]
+            )
+
+    def test_chained(self):
+        base_fname = self.path("base.rag")
+        first = self.path("first.rag")
+        second = self.path("second.rag")
+
+        data = copy.deepcopy(self.data)
+        data["ui"]["name"] = "Changed again"
+
+        ragfile.write(base_fname, self.base)
+        rag.write_patch(first, base_fname, self.data)
+        rag.write_patch(second, first, data)
+
+        self.assertEqual(normalise(rag.read(second)), data)
+
+    def test_base_changed_on_disk(self):
+        base_fname = self.path("base.rag")
+        fname = self.path("patch.rag")
+
+        ragfile.write(base_fname, self.base)
+        rag.write_patch(fname, base_fname, self.data)
+
+        time.sleep(0.01)
+        shutil.copy(asset("manikin.rag"), base_fname + ".tmp")
+        os.remove(base_fname)
+        os.rename(base_fname + ".tmp", base_fname)
+
+        with self.assertLogs("ragdoll", logging.WARNING):
+            rag.read(fname)
+
+    def test_base_hashed_once(self):
+        base_fname = self.path("base.rag")
+        fname = self.path("patch.rag")
+
+        ragfile.write(base_fname, self.base)
+        rag.write_patch(fname, base_fname, self.data)
+
+        hashed = []
+        _sha1 = rag._sha1
+
+        def spy(fname):
+            hashed.append(fname)
+            return _sha1(fname)
+
+        rag._sha1 = spy
+
+        try:
+            rag.read(fname, cached=True)
+            rag.read(fname, cached=True)
+        finally:
+            rag._sha1 = _sha1
+
+        self.assertEqual(hashed, [base_fname])
+
+    def test_patch_of_itself(self):
+        fname = self.path("patch.rag")
+        ragfile.write(fname, self.base)
+
+        with self.assertRaises(AssertionError):
+            rag.write_patch(fname, fname, self.data)
+
+
+class TestValidate(unittest.TestCase):
+
+    def test_assets(self):
+        for name in ("manikin.rag", "dog.rag"):
+            data = ragfile.read(asset(name), indexed=False)
+            self.assertEqual(rag.validate(data), [])
+
+    def test_missing_component(self):
+        data = normalise(ragfile.read(asset("manikin.rag"), indexed=False))
+
+        for value in data["entities"].values():
+            if "MarkerUIComponent" in value["components"]:
+                value["components"].pop("RestComponent")
+                break
+
+        self.assertTrue(rag.validate(data))
+
+
+class TestCommands(TempDirTestCase):
+
+    def run_command(self, *argv):
+        stdout, sys.stdout = sys.stdout, io.StringIO()
+
+        try:
+            code = rag.main(list(argv))
+            return code, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_validate(self):
+        fname = self.path("character.rag")
+        shutil.copy(asset("manikin.rag"), fname)
+
+        code, output = self.run_command("validate", fname)
+        self.assertEqual(code, 0)
+        self.assertEqual(output, "%s: ok\n" % fname)
+
+        # Files read once aren't worth indexing
+        self.assertFalse(os.path.exists(ragfile.IndexDirectory))
+
+    def test_stats(self):
+        code, output = self.run_command("stats", asset("manikin.rag"))
+        self.assertEqual(code, 0)
+        self.assertIn("Markers: ", output)
+        self.assertFalse(os.path.exists(ragfile.IndexDirectory))
+
+
+if __name__ == "__main__":
+    unittest.main()
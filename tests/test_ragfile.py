@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import shutil
+import random
+import unittest
+
+from ragdoll import ragfile, rag, constants
+
+from .util import TempDirTestCase, asset, normalise
+
+try:
+    import lzma  # noqa
+except ImportError:
+    lzma = None
+
+
+class RoundTripTestCase(TempDirTestCase):
+    """Whatever is written is read back as-is"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.original = normalise(
+            ragfile.read(asset("manikin.rag"), indexed=False)
+        )
+
+    def assert_round_trip(self, opts):
+        fname = self.path("character.rag")
+        ragfile.write(fname, self.original, opts)
+
+        self.assertEqual(normalise(ragfile.read(fname)), self.original)
+        self.assertEqual(ragfile.options(fname), {
+            "format": opts.get("format", constants.FormatAscii),
+            "compression": opts.get("compression",
+                                    constants.CompressionOff),
+        })
+
+
+class TestFormat(RoundTripTestCase):
+
+    def test_ascii(self):
+        self.assert_round_trip({})
+
+    def test_binary(self):
+        self.assert_round_trip({"format": constants.FormatBinary})
+
+    def test_binary_lazy(self):
+        fname = self.path("character.rag")
+        ragfile.write(fname, self.original, {
+            "format": constants.FormatBinary
+        })
+
+        data = ragfile.read(fname)
+        entity = next(iter(data["entities"].values()))
+        self.assertIsInstance(entity["components"], ragfile._Lazy)
+
+
+class TestChanged(TempDirTestCase):
+    """Components are never read from a file other than the one read"""
+
+    def replace(self, fname):
+        # Some file systems only store mtime in whole seconds
+        time.sleep(0.01)
+
+        with open(fname, "rb") as f:
+            content = f.read()
+
+        with open(fname + ".tmp", "wb") as f:
+            f.write(content + b"\n")
+
+        os.remove(fname)
+        os.rename(fname + ".tmp", fname)
+
+    def assert_refused(self, fname):
+        data = ragfile.read(fname)
+        self.replace(fname)
+
+        entity = next(iter(data["entities"].values()))
+        with self.assertRaises(IOError):
+            dict(entity["components"])
+
+    def test_binary(self):
+        fname = self.path("character.rag")
+        data = ragfile.read(asset("manikin.rag"), indexed=False)
+        ragfile.write(fname, data, {"format": constants.FormatBinary})
+        self.assert_refused(fname)
+
+    def test_indexed(self):
+        fname = self.path("character.rag")
+        shutil.copy(asset("manikin.rag"), fname)
+
+        # Index on first read, lazy on the next
+        ragfile.read(fname)
+        self.assert_refused(fname)
+
+
+class TestCompression(RoundTripTestCase):
+
+    def test_ascii_compact(self):
+        self.assert_round_trip({"compact": True})
+
+    def test_ascii_gzip(self):
+        self.assert_round_trip({"compression": constants.CompressionGzip})
+
+    def test_binary_gzip(self):
+        self.assert_round_trip({
+            "format": constants.FormatBinary,
+            "compression": constants.CompressionGzip,
+        })
+
+    @unittest.skipIf(lzma is None, "lzma not supported by this Python")
+    def test_binary_lzma(self):
+        self.assert_round_trip({
+            "format": constants.FormatBinary,
+            "compression": constants.CompressionLzma,
+        })
+
+
+class TestIndex(TempDirTestCase):
+
+    def setUp(self):
+        super(TestIndex, self).setUp()
+        self.fname = self.path("character.rag")
+        shutil.copy(asset("manikin.rag"), self.fname)
+
+    def test_indexed_on_first_read(self):
+        self.assertIsNone(ragfile._read_index(self.fname))
+        first = ragfile.read(self.fname)
+        self.assertIsNotNone(ragfile._read_index(self.fname))
+
+        second = ragfile.read(self.fname)
+        self.assertIsInstance(
+            next(iter(second["entities"].values()))["components"],
+            ragfile._Lazy
+        )
+
+        self.assertEqual(normalise(first), normalise(second))
+
+    def test_invalidated_on_change(self):
+        ragfile.read(self.fname)
+
+        # Some file systems only store mtime in whole seconds
+        time.sleep(0.01)
+        with open(self.fname, "ab") as f:
+            f.write(b"\n")
+
+        self.assertIsNone(ragfile._read_index(self.fname))
+
+    def test_not_read_whole_once_indexed(self):
+        ragfile.read(self.fname)
+
+        # Opened, but only to tell what format it is
+        _open = ragfile._open
+        read = []
+
+        def spy(*args, **kwargs):
+            f = _open(*args, **kwargs)
+            original = f.read
+
+            def _read(*args):
+                data = original(*args)
+                read.append(len(data))
+                return data
+
+            f.read = _read
+            return f
+
+        ragfile._open = spy
+
+        try:
+            ragfile.read(self.fname)
+        finally:
+            ragfile._open = _open
+
+        self.assertLess(sum(read), 100)
+
+    def test_corrupt_index(self):
+        ragfile.read(self.fname)
+        path = ragfile._index_path(self.fname)
+
+        with open(path) as f:
+            fname, index = f.readlines()
+
+        index = json.loads(index)
+        index["header"] = {"schema": [0, 3]}
+
+        with open(path, "w") as f:
+            f.write(fname + json.dumps(index))
+
+        # Read as though it was never indexed
+        self.assertEqual(normalise(ragfile.read(self.fname)),
+                         normalise(ragfile.read(self.fname, indexed=False)))
+
+    def test_outdated_index(self):
+        os.makedirs(ragfile.IndexDirectory)
+
+        # Indices prior to version 3 were one line, without a path
+        with open(ragfile._index_path(self.fname), "w") as f:
+            json.dump({"version": 2, "size": 0, "mtime": 0}, f)
+
+        ragfile._prune_indices(ragfile.IndexBudget)
+        self.assertEqual(os.listdir(ragfile.IndexDirectory), [])
+
+        with open(ragfile._index_path(self.fname), "w") as f:
+            json.dump({"version": 2, "size": 0, "mtime": 0}, f)
+
+        ragfile._unpruned = None
+        ragfile.read(self.fname)
+        self.assertIsNotNone(ragfile._read_index(self.fname))
+
+    def test_pruned_every_so_often(self):
+        pruned = []
+        _prune_indices = ragfile._prune_indices
+        ragfile._prune_indices = pruned.append
+        ragfile._unpruned = None
+
+        try:
+            for index in range(5):
+                fname = self.path("character%d.rag" % index)
+                shutil.copy(self.fname, fname)
+                ragfile.read(fname)
+        finally:
+            ragfile._prune_indices = _prune_indices
+
+        self.assertEqual(pruned, [ragfile.IndexBudget])
+
+        # Never half-written
+        self.assertEqual(
+            sorted(os.path.splitext(name)[1]
+                   for name in os.listdir(ragfile.IndexDirectory)),
+            [".json"] * 5
+        )
+
+    def test_pruned(self):
+        other = self.path("other.rag")
+        shutil.copy(self.fname, other)
+
+        ragfile.read(self.fname)
+        ragfile.read(other)
+        self.assertEqual(len(os.listdir(ragfile.IndexDirectory)), 2)
+
+        os.remove(other)
+        ragfile._prune_indices(ragfile.IndexBudget)
+        self.assertEqual(len(os.listdir(ragfile.IndexDirectory)), 1)
+
+        ragfile._prune_indices(0)
+        self.assertEqual(len(os.listdir(ragfile.IndexDirectory)), 0)
+
+
+class TestMetadata(RoundTripTestCase):
+
+    def test_summarised(self):
+        fname = self.path("character.rag")
+        ragfile.write(fname, self.original, {
+            "format": constants.FormatBinary
+        })
+
+        metadata = ragfile.read_metadata(fname, fallback=False)
+        self.assertEqual(metadata, ragfile.summarise(self.original))
+
+    def test_fallback(self):
+        fname = self.path("character.rag")
+        shutil.copy(asset("manikin.rag"), fname)
+
+        self.assertIsNone(ragfile.read_metadata(fname, fallback=False))
+        self.assertEqual(
+            ragfile.read_metadata(fname)["counts"],
+            ragfile.summarise(self.original)["counts"]
+        )
+
+
+class TestPool(RoundTripTestCase):
+
+    def test_off_by_default(self):
+        fname = self.path("character.rag")
+        ragfile.write(fname, self.original)
+
+        data = ragfile.read(fname, indexed=False)
+        self.assertNotIn("meshes", data)
+
+        for value in data["entities"].values():
+            meshes = value["components"].get("ConvexMeshComponents")
+
+            if meshes is not None:
+                self.assertIn("vertices", meshes["members"])
+
+    def test_pooled(self):
+        pooled = normalise(ragfile.pool_meshes(self.original))
+
+        for fmt in (constants.FormatAscii, constants.FormatBinary):
+            fname = self.path("character.rag")
+            ragfile.write(fname, self.original, {"format": fmt, "pool": True})
+            self.assertEqual(normalise(ragfile.read(fname)), pooled)
+
+    def test_registry(self):
+        pooled = rag.Registry(ragfile.pool_meshes(self.original))
+        registry = rag.Registry(self.original)
+
+        for entity in registry.view("ConvexMeshComponents"):
+            a = registry.get(entity, "ConvexMeshComponents")
+            b = pooled.get(entity, "ConvexMeshComponents")
+
+            self.assertEqual(a["vertices"].tolist(), b["vertices"].tolist())
+            self.assertEqual(list(a["indices"]), list(b["indices"]))
+
+
+class TestQuantize(TempDirTestCase):
+
+    def test_error_bound(self):
+        rand = random.Random(0)
+
+        for error in (0.1, 0.001, 0.0001):
+            values = [rand.uniform(-1, 1) for _ in range(300)]
+            quantized = ragfile.quantize(
+                {"type": "PointArray", "values": values}, error
+            )
+
+            bounds = quantized["bounds"]
+            steps = [
+                (high - low) / ragfile.QuantizedSteps
+                for low, high in zip(bounds[:3], bounds[3:])
+            ]
+
+            for index, (value, step) in enumerate(
+                    zip(values, quantized["values"])):
+                axis = index % 3
+                decoded = bounds[axis] + step * steps[axis]
+                self.assertLessEqual(abs(decoded - value), error)
+
+    def test_too_large(self):
+        points = {"type": "PointArray", "values": [0, 0, 0, 1000, 0, 0]}
+        self.assertIsNone(ragfile.quantize(points, error=0.001))
+
+    def test_quantized_file(self):
+        data = ragfile.pool_meshes(
+            ragfile.read(asset("manikin.rag"), indexed=False)
+        )
+
+        fname = os.path.join(self.tempdir, "character.rag")
+        ragfile.write(fname, data, {"quantize": True, "quantizeError": 0.001})
+        quantized = ragfile.read(fname)
+
+        count = 0
+
+        for key, mesh in data["meshes"].items():
+            vertices = quantized["meshes"][key]["vertices"]
+
+            # Too large to quantize within the error, left as-is
+            if vertices["type"] == "PointArray":
+                self.assertEqual(vertices, mesh["vertices"])
+                continue
+
+            count += 1
+            decoded = rag.QuantizedPointArray(
+                vertices["values"], vertices["bounds"]
+            ).dequantize().tolist()
+
+            original = mesh["vertices"]["values"]
+            decoded = [value for point in decoded for value in point]
+
+            self.assertEqual(len(decoded), len(original))
+
+            for a, b in zip(decoded, original):
+                self.assertLessEqual(abs(a - b), 0.001)
+
+        self.assertGreater(count, 0)
+
+
+class TestReadCache(TempDirTestCase):
+
+    def test_hit_and_invalidate(self):
+        fname = self.path("character.rag")
+        shutil.copy(asset("manikin.rag"), fname)
+
+        first = ragfile.read(fname, cached=True)
+        self.assertIs(ragfile.read(fname, cached=True), first)
+
+        time.sleep(0.01)
+        with open(fname, "ab") as f:
+            f.write(b"\n")
+
+        self.assertIsNot(ragfile.read(fname, cached=True), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from ragdoll import ragfile
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_assets = os.path.join(_root, "ragdoll", "resources", "assets")
+
+
+def asset(name):
+    return os.path.join(_assets, name)
+
+
+def normalise(data):
+    """Return `data` fully read, comparable regardless of how it was read"""
+    data = ragfile.materialise(data)
+    data.pop("metadata", None)
+    return json.loads(json.dumps(data, sort_keys=True, default=list))
+
+
+class TempDirTestCase(unittest.TestCase):
+    """Every test gets a directory of its own, along with its own indices"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+        self._index_directory = ragfile.IndexDirectory
+        ragfile.IndexDirectory = os.path.join(self.tempdir, "index")
+        ragfile.cache.clear()
+
+    def tearDown(self):
+        ragfile.IndexDirectory = self._index_directory
+        ragfile.cache.clear()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.tempdir, name)
@@ -1,61 +1,30 @@
 import os
-import json
 import argparse
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--fname")
-opts = parser.parse_args()
+from ragdoll import batch
 
-dirname = os.path.dirname(__file__)
-assets = os.path.join(dirname, "ragdoll", "resources", "assets")
 
-for asset in [opts.fname] if opts.fname else os.listdir(assets):
-    fname = os.path.join(assets, asset)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fname")
+    opts = parser.parse_args()
 
-    with open(fname) as f:
-        content = json.load(f)
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    assets = os.path.join(dirname, "ragdoll", "resources", "assets")
 
-    for entity, data in content["entities"].items():
-        components = data["components"]
+    fnames = [
+        os.path.join(assets, asset)
+        for asset in ([opts.fname] if opts.fname else os.listdir(assets))
+    ]
 
-        if "GroupUIComponent" in components:
-            ui = components["GroupUIComponent"]["members"]
-            ui["useLinearAngularStiffness"] = True
+    for result in batch.run(fnames, transforms=["linearAngularStiffness"]):
+        if result["error"]:
+            print("Failed %s\n%s" % (result["fname"], result["error"]))
 
-            ang_stiffness = ui["stiffness"]
-            ang_damping = ui["dampingRatio"]
-            lin_stiffness = ui["driveRelativeLinearStiffness"]
-            lin_damping = ui["driveRelativeLinearDampingRatio"]
+        elif result["written"]:
+            print("Upgraded %s" % result["fname"])
 
-            ui["angularStiffness"] = ang_stiffness
-            ui["angularDampingRatio"] = ang_damping
-            ui["linearStiffness"] = lin_stiffness
-            ui["linearDampingRatio"] = lin_damping
 
-        if "MarkerUIComponent" in components:
-            ui = components["MarkerUIComponent"]["members"]
-            ui["useLinearAngularStiffness"] = True
-
-            ang_stiffness = ui["driveStiffness"]
-            ang_damping = ui["driveDampingRatio"]
-            lin_stiffness = ui["driveRelativeLinearStiffness"]
-            lin_damping = ui["driveRelativeLinearDampingRatio"]
-
-            ui["angularStiffness"] = ang_stiffness
-            ui["angularDampingRatio"] = ang_damping
-            ui["linearStiffness"] = lin_stiffness
-            ui["linearDampingRatio"] = lin_damping
-
-        if "PinJointUIComponent" in components:
-            con = components["PinJointUIComponent"]["members"]
-            con["useScale"] = True
-
-        if "DistanceJointUIComponent" in components:
-            con = components["DistanceJointUIComponent"]["members"]
-            con["useScale"] = True
-            con["useScaleForDistance"] = True
-
-    with open(fname, "w") as f:
-        json.dump(content, f, sort_keys=True, indent=4)
-
-    print("Upgraded %s" % fname)
+# Workers of the process pool import this module too
+if __name__ == "__main__":
+    main()